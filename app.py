@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 
 import json
+import os
 
-from flask import Flask, make_response, render_template
+from flask import Flask, Response, make_response, render_template
 from werkzeug.debug import DebuggedApplication
 
 import app_config
-from render_utils import make_context, smarty_filter, urlencode_filter
+from etc.bytecode_cache import jinja_bytecode_cache
+from render_utils import install_render_profiler, make_context, preload_templates, profile_section, smarty_filter, urlencode_filter
 import static
+import watcher
 
 app = Flask(__name__)
 app.debug = app_config.DEBUG
@@ -15,6 +18,10 @@ app.debug = app_config.DEBUG
 app.add_template_filter(smarty_filter, name='smarty')
 app.add_template_filter(urlencode_filter, name='urlencode')
 
+app.jinja_env.bytecode_cache = jinja_bytecode_cache('app')
+
+install_render_profiler(app)
+
 # Example application views
 @app.route('/')
 def index():
@@ -23,8 +30,9 @@ def index():
     """
     context = make_context()
 
-    with open('data/featured.json') as f:
-        context['featured'] = json.load(f)
+    with profile_section('featured.json'):
+        with open('data/featured.json') as f:
+            context['featured'] = json.load(f)
 
     return make_response(render_template('index.html', **context))
 
@@ -51,6 +59,43 @@ def test_widget():
 
 app.register_blueprint(static.static)
 
+# Live reload for "fab app", see watcher.py
+if os.environ.get('DEV_WATCHER'):
+    watcher.start()
+
+    RELOAD_SCRIPT = """<script type="text/javascript">
+new EventSource('/_dev/events').addEventListener('change', function(e) {
+    if (e.data !== 'less') {
+        return window.location.reload();
+    }
+
+    var links = document.querySelectorAll('link[rel=stylesheet]');
+
+    for (var i = 0; i < links.length; i++) {
+        links[i].href = links[i].href.replace(/\\?.*$/, '') + '?' + Date.now();
+    }
+});
+</script>"""
+
+    @app.route('/_dev/events')
+    def _dev_events():
+        """
+        Stream change notifications to the browser.
+        """
+        return Response(watcher.get().events(), mimetype='text/event-stream')
+
+    @app.after_request
+    def _inject_reload_script(response):
+        """
+        Add the live reload client to rendered pages.
+        """
+        if response.mimetype == 'text/html' and not response.direct_passthrough:
+            response.data = response.data.replace('</body>', '%s</body>' % RELOAD_SCRIPT)
+
+        return response
+
+preload_templates(app.jinja_env)
+
 # Enable Werkzeug debug pages
 if app_config.DEBUG:
     wsgi_app = DebuggedApplication(app, evalex=False)
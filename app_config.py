@@ -73,6 +73,9 @@ DEPLOY_SERVICES = False
 
 UWSGI_SOCKET_PATH = '/tmp/%s.uwsgi.sock' % PROJECT_FILENAME
 
+# Compiled Jinja templates, shared by every worker and fab run
+JINJA_BYTECODE_CACHE_PATH = '/tmp/%s.jinja' % PROJECT_FILENAME
+
 # Services are the server-side services we want to enable and configure.
 # A three-tuple following this format:
 # (service name, service deployment path, service config file extension)
@@ -90,6 +93,10 @@ SERVERS = []
 SERVER_BASE_URL = None
 SERVER_LOG_PATH = None 
 DEBUG = True
+PAGE_CACHE_TTL = 0 # seconds, 0 disables public_app's rendered page cache
+
+# Bumped by configure_targets() so cached copies of this config know to expire
+_targets_version = 0
 
 """
 COPY EDITING
@@ -97,6 +104,30 @@ COPY EDITING
 COPY_GOOGLE_DOC_URL = 'https://docs.google.com/spreadsheet/ccc?key=0AlXMOHKxzQVRdHZuX1UycXplRlBfLVB0UVNldHJYZmc&usp=drive_web#gid=1'
 COPY_PATH = 'data/copy.xlsx'
 
+# Pre-parsed copy written by "fab text.update" so readers can skip openpyxl
+COPY_SNAPSHOT_PATH = 'data/copy.pickle'
+
+# Worker processes used to minify bundles in "fab render" (None means one per CPU)
+COMPRESS_PROCESSES = None
+
+# Bundles with fewer files than this are minified in-process
+COMPRESS_PARALLEL_MIN_FILES = 4
+
+# Per-input sizes and minify times for each compiled bundle
+BUNDLE_REPORT_PATH = 'data/bundle_report.json'
+
+# "fab render" fails if any compiled bundle is bigger than this once gzipped (None disables)
+BUNDLE_GZIP_BUDGET = 200 * 1024
+
+# Number of strings each of the smarty/urlencode filters remembers (0 disables)
+FILTER_CACHE_SIZE = 1024
+
+"""
+LINKLATER
+"""
+# SQLite archive of every link unfurled, used to skip repeats and for search
+LINK_ARCHIVE_PATH = 'data/links.db'
+
 """
 SHARING
 """
@@ -155,6 +186,8 @@ def configure_targets(deployment_target):
     global DEBUG
     global DEPLOYMENT_TARGET
     global DISQUS_SHORTNAME
+    global PAGE_CACHE_TTL
+    global _targets_version
 
     if deployment_target == 'production':
         S3_BUCKET = PRODUCTION_S3_BUCKET
@@ -165,6 +198,7 @@ def configure_targets(deployment_target):
         SERVER_LOG_PATH = '/var/log/%s' % PROJECT_FILENAME
         DISQUS_SHORTNAME = 'npr-news'
         DEBUG = False
+        PAGE_CACHE_TTL = 60
     elif deployment_target == 'staging':
         S3_BUCKET = STAGING_S3_BUCKET
         S3_BASE_URL = 'http://%s/%s' % (S3_BUCKET['bucket_name'], PROJECT_SLUG)
@@ -174,6 +208,7 @@ def configure_targets(deployment_target):
         SERVER_LOG_PATH = '/var/log/%s' % PROJECT_FILENAME
         DISQUS_SHORTNAME = 'nprviz-test'
         DEBUG = True
+        PAGE_CACHE_TTL = 60
     else:
         S3_BUCKET = None
         S3_BASE_URL = 'http://127.0.0.1:8000'
@@ -183,8 +218,10 @@ def configure_targets(deployment_target):
         SERVER_LOG_PATH = '/tmp'
         DISQUS_SHORTNAME = 'nprviz-test'
         DEBUG = True
+        PAGE_CACHE_TTL = 0
 
     DEPLOYMENT_TARGET = deployment_target
+    _targets_version += 1
 
 """
 Run automated configuration
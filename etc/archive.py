@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""
+A SQLite archive of every link linklater has unfurled.
+
+Used to skip links that were already posted in a previous week and
+to search old links by title, description and URL.
+"""
+
+from datetime import datetime
+import sqlite3
+
+from etc.dedupe import normalize_url
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    canonical_url TEXT,
+    title TEXT,
+    description TEXT,
+    image TEXT,
+    tweet_ids TEXT NOT NULL DEFAULT '',
+    week TEXT NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS links_url_week ON links (url, week);
+CREATE INDEX IF NOT EXISTS links_canonical_url ON links (canonical_url);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS links_search USING fts4(url, title, description);
+"""
+
+def canonical_url_of(link):
+    """
+    The canonical URL the page gave, or failing that its normalized URL.
+    """
+    return link.get('canonical_url') or normalize_url(link['url'])
+
+def week_of(date=None):
+    """
+    The ISO week a date falls in, e.g. "2015-W04".
+    """
+    year, week, weekday = (date or datetime.now()).isocalendar()
+
+    return '%04i-W%02i' % (year, week)
+
+class LinkArchive(object):
+    """
+    Links keyed by URL and week. Each row also appears in an FTS index
+    (links_search) under the same id.
+    """
+    def __init__(self, path, lock_timeout=60):
+        self.connection = sqlite3.connect(path, timeout=lock_timeout)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+        # Links archived without a canonical URL couldn't be matched by one
+        with self.connection:
+            self.connection.executemany(
+                'UPDATE links SET canonical_url = ? WHERE id = ?',
+                [(normalize_url(row['url']), row['id']) for row in self.connection.execute('SELECT id, url FROM links WHERE canonical_url IS NULL')]
+            )
+
+    def close(self):
+        self.connection.close()
+
+    def seen_before(self, link, week):
+        """
+        Was this link (by URL or canonical URL) archived in another week?
+        """
+        canonical_url = canonical_url_of(link)
+
+        row = self.connection.execute(
+            'SELECT 1 FROM links WHERE (url = ? OR canonical_url = ?) AND week != ? LIMIT 1',
+            (link['url'], canonical_url, week)
+        ).fetchone()
+
+        return row is not None
+
+    def add(self, link, week):
+        """
+        Archive a link, merging tweet ids if it's already there for this week.
+        """
+        tweet_id = link.get('tweet_url', '').split('/')[-1]
+
+        with self.connection:
+            row = self.connection.execute(
+                'SELECT id, tweet_ids FROM links WHERE url = ? AND week = ?',
+                (link['url'], week)
+            ).fetchone()
+
+            if row:
+                tweet_ids = set(filter(None, row['tweet_ids'].split(',')))
+                tweet_ids.add(tweet_id)
+
+                self.connection.execute(
+                    'UPDATE links SET tweet_ids = ? WHERE id = ?',
+                    (','.join(sorted(filter(None, tweet_ids))), row['id'])
+                )
+
+                return row['id']
+
+            cursor = self.connection.execute(
+                'INSERT INTO links (url, canonical_url, title, description, image, tweet_ids, week) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (link['url'], canonical_url_of(link), link.get('title'), link.get('description'), link.get('image'), tweet_id, week)
+            )
+
+            self.connection.execute(
+                'INSERT INTO links_search (docid, url, title, description) VALUES (?, ?, ?, ?)',
+                (cursor.lastrowid, link['url'], link.get('title') or '', link.get('description') or '')
+            )
+
+            return cursor.lastrowid
+
+    def search(self, query, limit=20):
+        """
+        Full-text search of archived links, newest first.
+        """
+        return self.connection.execute(
+            'SELECT links.* FROM links_search JOIN links ON links.id = links_search.docid WHERE links_search MATCH ? ORDER BY links.week DESC LIMIT ?',
+            (query, limit)
+        ).fetchall()
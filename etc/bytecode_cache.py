@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+"""
+Jinja bytecode caching, kept apart from render_utils so the fabfile
+can use it without importing Flask.
+"""
+
+import os
+
+from jinja2 import FileSystemBytecodeCache
+
+import app_config
+
+def jinja_bytecode_cache(name):
+    """
+    Returns a filesystem bytecode cache so templates are compiled once
+    and reused across worker recycles.
+
+    `name` namespaces the cache files: environments with different
+    settings (e.g. autoescaping) compile the same template differently.
+    """
+    try:
+        os.makedirs(app_config.JINJA_BYTECODE_CACHE_PATH)
+    except OSError:
+        pass
+
+    return FileSystemBytecodeCache(app_config.JINJA_BYTECODE_CACHE_PATH, '__%s_%%s.cache' % name)
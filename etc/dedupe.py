@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+Helpers for spotting the same story behind different links.
+"""
+
+import re
+from urlparse import urlsplit, urlunsplit
+
+# Query parameters that never change which page you get
+TRACKING_PARAMS = re.compile(r'^(utm_\w+|ft|fb_\w+|ref|src|cmpid|mc_\w+)$')
+
+WORD_REGEX = re.compile(r'\w+', re.UNICODE)
+
+# Keeps the MinHash arithmetic within a machine word
+MERSENNE_PRIME = (1 << 31) - 1
+
+def normalize_url(url):
+    """
+    Drop fragments and tracking parameters and lowercase the host so
+    trivially different URLs compare equal.
+    """
+    scheme, netloc, path, query, fragment = urlsplit(url)
+
+    # Filter the raw pairs rather than decoding and re-encoding them, which
+    # fails on unicode URLs with non-ASCII (or percent-encoded UTF-8) values
+    query = '&'.join(
+        pair for pair in query.split('&')
+        if pair and not TRACKING_PARAMS.match(pair.split('=', 1)[0])
+    )
+
+    return urlunsplit((scheme.lower(), netloc.lower(), path or '/', query, ''))
+
+def shingles(text, size=3):
+    """
+    The set of `size`-word shingles in a piece of text.
+    """
+    words = WORD_REGEX.findall(text.lower())
+
+    if len(words) < size:
+        return set([' '.join(words)]) if words else set()
+
+    return set(' '.join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+class MinHasher(object):
+    """
+    Estimates the Jaccard similarity of shingle sets with MinHash, and
+    finds candidate near-duplicates in roughly linear time by banding
+    the signatures (locality-sensitive hashing).
+
+    Texts with fewer than `min_shingles` shingles are never treated as
+    duplicates: two short titles like "Video" say nothing about whether
+    the pages are the same.
+    """
+    def __init__(self, bands=16, rows=4, threshold=0.8, min_shingles=3):
+        self.bands = bands
+        self.rows = rows
+        self.threshold = threshold
+        self.min_shingles = min_shingles
+
+        # Fixed coefficients so signatures are stable between runs
+        count = bands * rows
+        self.coefficients = [((i * 2654435761 + 1) % MERSENNE_PRIME, (i * 40503 + 7) % MERSENNE_PRIME) for i in range(1, count + 1)]
+
+    def signature(self, shingle_set):
+        hashes = [hash(shingle) & MERSENNE_PRIME for shingle in shingle_set]
+
+        return tuple(
+            min([(a * h + b) % MERSENNE_PRIME for h in hashes]) for a, b in self.coefficients
+        )
+
+    def similarity(self, a, b):
+        return sum(1 for x, y in zip(a, b) if x == y) / float(len(a))
+
+    def duplicates(self, texts):
+        """
+        Indices of texts that are near-duplicates of an earlier text.
+        """
+        buckets = {}
+        signatures = {}
+        duplicates = []
+
+        for i, text in enumerate(texts):
+            shingle_set = shingles(text)
+
+            if len(shingle_set) < self.min_shingles:
+                continue
+
+            signature = self.signature(shingle_set)
+            keys = [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+            candidates = set()
+
+            for key in keys:
+                candidates.update(buckets.get(key, []))
+
+            if any(self.similarity(signature, signatures[j]) >= self.threshold for j in candidates):
+                duplicates.append(i)
+                continue
+
+            signatures[i] = signature
+
+            for key in keys:
+                buckets.setdefault(key, []).append(i)
+
+        return duplicates
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""
+A persistent negative cache of URLs and hosts that failed to unfurl.
+
+Failing URLs are skipped until their backoff expires. Each further
+failure doubles the backoff. Hosts that are timing out or erroring are
+tracked too, but are still tried; a host's backoff grows at most once
+per window, however many of its URLs fail in the meantime.
+
+Entries are loaded into memory when the cache is opened, so it's safe
+to share between unfurling threads, and written back by `save()`.
+"""
+
+import sqlite3
+import threading
+import time
+
+from etc.hosts import host_of
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS failures (
+    key TEXT PRIMARY KEY,
+    failures INTEGER NOT NULL,
+    retry_after REAL NOT NULL,
+    reason TEXT
+);
+"""
+
+class NegativeCache(object):
+    """
+    Keys are "url:<url>" or "host:<host>".
+    """
+    def __init__(self, path, base=3600, limit=30 * 86400, lock_timeout=60):
+        self.path = path
+        self.lock_timeout = lock_timeout
+        self.base = base
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.stats = {
+            'skipped': 0,
+            'failed': 0,
+            'recovered': 0
+        }
+
+        connection = sqlite3.connect(path, timeout=lock_timeout)
+        connection.executescript(SCHEMA)
+
+        self.entries = dict(
+            (key, { 'failures': failures, 'retry_after': retry_after, 'reason': reason })
+            for key, failures, retry_after, reason in connection.execute('SELECT key, failures, retry_after, reason FROM failures')
+        )
+
+        connection.close()
+
+        self.removed = set()
+
+    def _active(self, key):
+        entry = self.entries.get(key)
+
+        if entry and entry['retry_after'] > time.time():
+            return entry
+
+        return None
+
+    def blocked(self, url):
+        """
+        The reason a URL is being skipped, or None if it should be fetched.
+        """
+        with self.lock:
+            entry = self._active('url:%s' % url)
+
+            if entry:
+                self.stats['skipped'] += 1
+
+                return entry['reason']
+
+        return None
+
+    def host_penalized(self, url):
+        """
+        Has this URL's host been failing recently?
+        """
+        with self.lock:
+            return self._active('host:%s' % host_of(url)) is not None
+
+    def _fail(self, key, reason):
+        entry = self.entries.get(key, { 'failures': 0 })
+        failures = entry['failures'] + 1
+
+        self.entries[key] = {
+            'failures': failures,
+            'retry_after': time.time() + min(self.base * 2 ** (failures - 1), self.limit),
+            'reason': reason
+        }
+        self.removed.discard(key)
+
+    def _fail_host(self, url, reason):
+        key = 'host:%s' % host_of(url)
+
+        # A struggling host fails for many URLs at once; count it
+        # once per backoff window rather than once per URL
+        if not self._active(key):
+            self._fail(key, reason)
+
+    def failed(self, url, reason, host_failure=True):
+        """
+        Record a failure. `host_failure` should be False for problems
+        with the page itself (a 404, say) rather than with the server.
+        """
+        with self.lock:
+            self.stats['failed'] += 1
+            self._fail('url:%s' % url, reason)
+
+            if host_failure:
+                self._fail_host(url, reason)
+
+    def host_failed(self, url, reason):
+        """
+        Record a failure of the server behind a URL without blocking the
+        URL itself, e.g. an API endpoint that's used for many links.
+        """
+        with self.lock:
+            self.stats['failed'] += 1
+            self._fail_host(url, reason)
+
+    def succeeded(self, url):
+        with self.lock:
+            for key in ('url:%s' % url, 'host:%s' % host_of(url)):
+                if self.entries.pop(key, None):
+                    self.stats['recovered'] += 1
+                    self.removed.add(key)
+
+    def save(self):
+        connection = sqlite3.connect(self.path, timeout=self.lock_timeout)
+        connection.executescript(SCHEMA)
+
+        with connection:
+            connection.executemany('DELETE FROM failures WHERE key = ?', [(key,) for key in self.removed])
+            connection.executemany(
+                'INSERT OR REPLACE INTO failures (key, failures, retry_after, reason) VALUES (?, ?, ?, ?)',
+                [(key, e['failures'], e['retry_after'], e['reason']) for key, e in self.entries.items()]
+            )
+
+        connection.close()
+
+    def report(self):
+        """
+        Lines summarizing this run and what's currently being avoided.
+        """
+        lines = ['Negative cache: %(skipped)i URLs skipped, %(failed)i new failures, %(recovered)i recovered' % self.stats]
+
+        now = time.time()
+
+        for key, entry in sorted(self.entries.items()):
+            if entry['retry_after'] > now:
+                lines.append('    %s (%s, %i failures, retry in %.1fh)' % (key, entry['reason'], entry['failures'], (entry['retry_after'] - now) / 3600))
+
+        return lines
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""
+Per-host politeness and timeouts for unfurling links.
+
+`HostLatencies` remembers how long each host takes to respond and
+derives a timeout from a high percentile of that, so fast hosts fail
+fast and slow ones get the time they need. `RateLimiter` is a token
+bucket per host, so a burst of links to one publisher doesn't hammer it.
+
+Both are safe to share between threads.
+"""
+
+import sqlite3
+import threading
+import time
+from urlparse import urlsplit
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS host_latencies (
+    host TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    recorded REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS host_latencies_host ON host_latencies (host, recorded);
+"""
+
+def host_of(url):
+    return urlsplit(url).netloc.lower()
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of numbers.
+    """
+    values = sorted(values)
+    index = max(int(round(fraction * len(values))) - 1, 0)
+
+    return values[min(index, len(values) - 1)]
+
+class HostLatencies(object):
+    """
+    The most recent `samples` response times for each host, persisted
+    between runs.
+    """
+    def __init__(self, path, default=5, minimum=1, maximum=10, fraction=0.95, multiplier=2, samples=50, min_samples=3, lock_timeout=60):
+        self.path = path
+        self.lock_timeout = lock_timeout
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.fraction = fraction
+        self.multiplier = multiplier
+        self.samples = samples
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+        self.added = []
+
+        connection = sqlite3.connect(path, timeout=lock_timeout)
+        connection.executescript(SCHEMA)
+
+        self.latencies = {}
+
+        for host, seconds in connection.execute('SELECT host, seconds FROM host_latencies ORDER BY recorded'):
+            self.latencies.setdefault(host, []).append(seconds)
+
+        connection.close()
+
+        for host in self.latencies:
+            self.latencies[host] = self.latencies[host][-samples:]
+
+    def record(self, url, seconds):
+        host = host_of(url)
+
+        with self.lock:
+            latencies = self.latencies.setdefault(host, [])
+            latencies.append(seconds)
+            del latencies[:-self.samples]
+
+            self.added.append((host, seconds, time.time()))
+
+    def timed_out(self, url, timeout):
+        """
+        Record a request that gave up after `timeout` seconds. The host
+        took at least that long, so it counts as a sample; otherwise a
+        host whose first responses were fast would never get longer.
+        """
+        self.record(url, timeout)
+
+    def timeout(self, url):
+        """
+        A multiple of the host's high-percentile latency, within bounds,
+        or the default for hosts we don't know yet.
+        """
+        with self.lock:
+            latencies = list(self.latencies.get(host_of(url), []))
+
+        if len(latencies) < self.min_samples:
+            return self.default
+
+        timeout = percentile(latencies, self.fraction) * self.multiplier
+
+        return min(max(timeout, self.minimum), self.maximum)
+
+    def save(self):
+        """
+        Store new samples and prune each host's history to `samples`.
+        """
+        connection = sqlite3.connect(self.path, timeout=self.lock_timeout)
+        connection.executescript(SCHEMA)
+
+        with connection:
+            connection.executemany('INSERT INTO host_latencies (host, seconds, recorded) VALUES (?, ?, ?)', self.added)
+
+            for host in set(host for host, seconds, recorded in self.added):
+                connection.execute(
+                    'DELETE FROM host_latencies WHERE host = ? AND rowid NOT IN (SELECT rowid FROM host_latencies WHERE host = ? ORDER BY recorded DESC LIMIT ?)',
+                    (host, host, self.samples)
+                )
+
+        connection.close()
+
+        self.added = []
+
+    def report(self, count=5):
+        """
+        Lines describing the slowest hosts.
+        """
+        timeouts = sorted(((self.timeout('http://%s/' % host), host) for host in self.latencies), reverse=True)
+
+        lines = ['Slowest hosts:']
+
+        for timeout, host in timeouts[:count]:
+            lines.append('    %s (p%i %.2fs, timeout %.1fs)' % (host, self.fraction * 100, percentile(self.latencies[host], self.fraction), timeout))
+
+        return lines
+
+class RateLimiter(object):
+    """
+    A token bucket per host: `burst` requests at once, then `rate`
+    requests per second.
+    """
+    def __init__(self, rate=1, burst=2):
+        self.rate = float(rate)
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.waited = 0
+
+    def reserve(self, url):
+        """
+        Take a token, returning how many seconds to wait before using it.
+        Tokens may go negative, which queues later callers behind this one.
+        """
+        host = host_of(url)
+        now = time.time()
+
+        with self.lock:
+            tokens, updated = self.buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate) - 1
+
+            self.buckets[host] = (tokens, now)
+
+            delay = max(0, -tokens / self.rate)
+            self.waited += delay
+
+        return delay
+
+    def wait(self, url):
+        delay = self.reserve(url)
+
+        if delay:
+            time.sleep(delay)
+
+def interleave_by_host(urls):
+    """
+    Round-robin URLs across hosts so a pool of workers isn't stuck
+    waiting on one host's rate limit while others sit idle.
+    """
+    by_host = {}
+    hosts = []
+
+    for url in urls:
+        host = host_of(url)
+
+        if host not in by_host:
+            by_host[host] = []
+            hosts.append(host)
+
+        by_host[host].append(url)
+
+    out = []
+
+    while hosts:
+        for host in list(hosts):
+            out.append(by_host[host].pop(0))
+
+            if not by_host[host]:
+                hosts.remove(host)
+
+    return out
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+A rough equivalent of Python 3's `python -X importtime` for Python 2.
+
+Usage (from the project root):
+
+    python etc/importtime.py <module> [<limit>]
+
+Prints every module imported while loading <module>, nested by who
+imported it, with self and cumulative time in microseconds, followed
+by the <limit> slowest imports.
+"""
+
+import __builtin__
+import os
+import sys
+import time
+
+_original_import = __builtin__.__import__
+_children = []
+_timings = []
+
+def _timed_import(name, *args, **kwargs):
+    """
+    Time first-time imports, attributing nested imports to their parent.
+    """
+    if name in sys.modules:
+        return _original_import(name, *args, **kwargs)
+
+    _children.append(0.0)
+    start = time.time()
+
+    try:
+        return _original_import(name, *args, **kwargs)
+    finally:
+        elapsed = time.time() - start
+        children = _children.pop()
+
+        if _children:
+            _children[-1] += elapsed
+
+        _timings.append((name, elapsed - children, elapsed, len(_children)))
+
+def profile(module):
+    """
+    Import a module, recording how long each of its imports takes.
+    """
+    __builtin__.__import__ = _timed_import
+
+    try:
+        __import__(module)
+    finally:
+        __builtin__.__import__ = _original_import
+
+    return _timings
+
+def main():
+    module = sys.argv[1]
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    sys.path.insert(0, os.getcwd())
+
+    timings = profile(module)
+
+    print 'import time: self [us] | cumulative | imported package'
+
+    for name, self_time, cumulative, depth in timings:
+        print 'import time: %11i | %10i | %s%s' % (self_time * 1e6, cumulative * 1e6, '  ' * depth, name)
+
+    print ''
+    print 'Slowest imports (cumulative):'
+
+    for name, self_time, cumulative, depth in sorted(timings, key=lambda t: -t[2])[:limit]:
+        print '%10.1fms %s' % (cumulative * 1e3, name)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+"""
+Unfurl links to well-known media hosts through their oEmbed endpoints.
+
+Pages on YouTube, Vimeo and the like are megabytes of script around a
+few og tags. Their oEmbed endpoints return the same information as a
+small JSON document, and some of it (YouTube thumbnails, say) can be
+worked out from the URL alone.
+
+    page = oembed.registry.unfurl('https://vimeo.com/76979871')
+
+Returns the same {url, canonical_url, title, description, image} shape
+as fabfile.data._grab_url, or None to fall back to scraping the page.
+"""
+
+import re
+import threading
+from urlparse import parse_qs, urlsplit
+
+import requests
+
+from etc.dedupe import normalize_url
+
+class Provider(object):
+    """
+    `pattern` is matched against the whole URL. `derive(url, match)`
+    can supply fields from the URL itself; oEmbed fields win.
+    """
+    def __init__(self, name, pattern, endpoint, derive=None):
+        self.name = name
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+        self.endpoint = endpoint
+        self.derive = derive
+
+class UnfurlStats(object):
+    """
+    Links each provider unfurled or left to scraping during one run.
+    Safe to share between unfurling threads.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, provider, outcome):
+        with self.lock:
+            counts = self.counts.setdefault(provider.name, { 'unfurled': 0, 'fell_back': 0 })
+            counts[outcome] += 1
+
+    def report(self):
+        lines = []
+
+        for name, counts in sorted(self.counts.items()):
+            lines.append('    %s: %i unfurled, %i fell back to the page' % (name, counts['unfurled'], counts['fell_back']))
+
+        return ['oEmbed:'] + lines if lines else []
+
+class Registry(object):
+    def __init__(self):
+        self.providers = []
+
+    def register(self, name, pattern, endpoint, derive=None):
+        provider = Provider(name, pattern, endpoint, derive)
+        self.providers.append(provider)
+
+        return provider
+
+    def provider_for(self, url):
+        """
+        The first provider matching a URL and the match, or (None, None).
+        """
+        for provider in self.providers:
+            match = provider.pattern.match(url)
+
+            if match:
+                return provider, match
+
+        return None, None
+
+    def unfurl(self, url, timeout=5, stats=None, negative_cache=None):
+        """
+        Page data for a URL from its provider, or None if no provider
+        matches or it didn't give us a title. The outcome is counted in
+        `stats`, an UnfurlStats, if given, and endpoints that time out,
+        can't be reached or return a server error are recorded against
+        their host in `negative_cache`.
+        """
+        provider, match = self.provider_for(url)
+
+        if not provider:
+            return None
+
+        data = provider.derive(url, match) if provider.derive else {}
+
+        try:
+            resp = requests.get(provider.endpoint, params={ 'url': url, 'format': 'json' }, timeout=timeout)
+            resp.raise_for_status()
+            oembed = resp.json()
+
+            if negative_cache:
+                negative_cache.succeeded(provider.endpoint)
+        except requests.exceptions.RequestException as e:
+            response = getattr(e, 'response', None)
+
+            # A 4xx is about this link; anything else is about the endpoint
+            if negative_cache and (response is None or response.status_code >= 500):
+                reason = 'HTTP %s' % response.status_code if response is not None else e.__class__.__name__
+                negative_cache.host_failed(provider.endpoint, 'oEmbed %s' % reason)
+
+            oembed = {}
+        except ValueError:
+            oembed = {}
+
+        if oembed.get('title'):
+            data['title'] = oembed['title']
+
+        if oembed.get('description') or oembed.get('author_name'):
+            data['description'] = oembed.get('description') or oembed['author_name']
+
+        if oembed.get('thumbnail_url'):
+            data['image'] = oembed['thumbnail_url']
+
+        if not data.get('title'):
+            if stats:
+                stats.count(provider, 'fell_back')
+
+            return None
+
+        if stats:
+            stats.count(provider, 'unfurled')
+
+        data['url'] = url
+        data.setdefault('canonical_url', normalize_url(url))
+
+        return data
+
+def _youtube(url, match):
+    """
+    The video id gives us a thumbnail and a canonical URL without asking.
+    """
+    scheme, netloc, path, query, fragment = urlsplit(url)
+
+    if netloc.lower().endswith('youtu.be'):
+        video_id = path.strip('/').split('/')[0]
+    else:
+        video_id = parse_qs(query).get('v', [''])[0]
+
+    if not video_id:
+        return {}
+
+    return {
+        'canonical_url': normalize_url('https://www.youtube.com/watch?v=%s' % video_id),
+        'image': 'https://i.ytimg.com/vi/%s/hqdefault.jpg' % video_id
+    }
+
+registry = Registry()
+
+registry.register('youtube', r'https?://((www|m)\.)?(youtube\.com/watch|youtu\.be/)', 'https://www.youtube.com/oembed', _youtube)
+registry.register('vimeo', r'https?://(www\.)?vimeo\.com/\d+', 'https://vimeo.com/api/oembed.json')
+registry.register('soundcloud', r'https?://(www\.|m\.)?soundcloud\.com/[^/]+/[^/?]+', 'https://soundcloud.com/oembed')
+registry.register('instagram', r'https?://(www\.)?instagr(\.am|am\.com)/p/', 'https://api.instagram.com/oembed')
+registry.register('flickr', r'https?://(www\.)?(flickr\.com/photos/|flic\.kr/p/)', 'https://www.flickr.com/services/oembed')
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""
+Tweets and unfurled pages collected ahead of the weekly linklater run.
+
+The prefetcher polls timelines through the week, storing new tweets
+and the pages they link to. linklater then only has to fetch the last
+few tweets and assemble the draft from what's here.
+"""
+
+from datetime import datetime, timedelta
+import json
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prefetched_tweets (
+    username TEXT NOT NULL,
+    tweet_id INTEGER NOT NULL,
+    created TEXT NOT NULL,
+    tweet TEXT NOT NULL,
+    PRIMARY KEY (username, tweet_id)
+);
+
+CREATE TABLE IF NOT EXISTS prefetched_pages (
+    url TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    fetched REAL NOT NULL
+);
+"""
+
+TWITTER_DATE_FORMAT = '%a %b %d %H:%M:%S +0000 %Y'
+
+class PrefetchStore(object):
+    """
+    Tweets by user, newest first, and unfurled pages by the URL tweeted.
+
+    The prefetcher and linklater can write the same database at once;
+    `lock_timeout` is how long to wait for the other's lock.
+    """
+    def __init__(self, path, lock_timeout=60):
+        self.connection = sqlite3.connect(path, timeout=lock_timeout)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def last_tweet_id(self, username):
+        row = self.connection.execute('SELECT MAX(tweet_id) FROM prefetched_tweets WHERE username = ?', (username,)).fetchone()
+
+        return row[0]
+
+    def add_tweets(self, username, tweets):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO prefetched_tweets (username, tweet_id, created, tweet) VALUES (?, ?, ?, ?)',
+                [
+                    (username, tweet['id'], datetime.strptime(tweet['created_at'], TWITTER_DATE_FORMAT).isoformat(), json.dumps(tweet))
+                    for tweet in tweets
+                ]
+            )
+
+    def tweets(self, username, days):
+        """
+        A user's stored tweets from the last `days` days, newest first.
+        """
+        since = (datetime.utcnow() - timedelta(days=int(days))).isoformat()
+
+        return [
+            json.loads(tweet) for tweet, in self.connection.execute(
+                'SELECT tweet FROM prefetched_tweets WHERE username = ? AND created >= ? ORDER BY tweet_id DESC',
+                (username, since)
+            )
+        ]
+
+    def pages(self, urls):
+        """
+        Stored unfurled pages for any of `urls`, by URL.
+        """
+        pages = {}
+        urls = list(urls)
+
+        # Stay under SQLite's limit on query parameters
+        for i in range(0, len(urls), 500):
+            batch = urls[i:i + 500]
+
+            for url, data in self.connection.execute(
+                'SELECT url, data FROM prefetched_pages WHERE url IN (%s)' % ','.join('?' * len(batch)),
+                batch
+            ):
+                pages[url] = json.loads(data)
+
+        return pages
+
+    def add_pages(self, pages):
+        """
+        Store unfurled pages. Failures (None) aren't stored, so they're
+        retried on the next pass.
+        """
+        now = time.time()
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO prefetched_pages (url, data, fetched) VALUES (?, ?, ?)',
+                [(url, json.dumps(data), now) for url, data in pages.items() if data]
+            )
+
+    def prune(self, days):
+        """
+        Forget tweets and pages older than `days` days.
+        """
+        since = datetime.utcnow() - timedelta(days=int(days))
+
+        with self.connection:
+            self.connection.execute('DELETE FROM prefetched_tweets WHERE created < ?', (since.isoformat(),))
+            self.connection.execute('DELETE FROM prefetched_pages WHERE fetched < ?', (time.time() - int(days) * 86400,))
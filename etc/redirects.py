@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""
+Resolve link shorteners to the pages they point to.
+
+Shortener hops are followed with HEAD requests, so nothing is downloaded
+until we reach the real page. Short links never change where they
+point, so every hop is remembered for good in the link archive database.
+"""
+
+import sqlite3
+import threading
+from urlparse import urljoin
+
+import requests
+
+from etc.hosts import host_of
+
+SHORTENERS = set([
+    'bit.ly', 'j.mp', 'n.pr', 'ow.ly', 't.co', 'goo.gl', 'tinyurl.com',
+    'buff.ly', 'fb.me', 'trib.al', 'wp.me', 'lnkd.in', 'dlvr.it', 'ift.tt',
+    'youtu.be', 'nyti.ms', 'wapo.st', 'econ.st', 'reut.rs', 'cnn.it'
+])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS redirects (
+    url TEXT PRIMARY KEY,
+    final_url TEXT NOT NULL
+);
+"""
+
+def is_shortener(url):
+    host = host_of(url)
+
+    if host.startswith('www.'):
+        host = host[4:]
+
+    return host in SHORTENERS
+
+class RedirectResolver(object):
+    """
+    Shortener URLs mapped to where they end up. Loaded into memory when
+    opened, so it's safe to share between threads; new mappings are
+    written back by `save()`.
+    """
+    def __init__(self, path, timeout=5, max_hops=10, lock_timeout=60):
+        self.path = path
+        self.lock_timeout = lock_timeout
+        self.timeout = timeout
+        self.max_hops = max_hops
+        self.lock = threading.Lock()
+        self.added = {}
+        self.stats = {
+            'cached': 0,
+            'hops': 0
+        }
+
+        connection = sqlite3.connect(path, timeout=lock_timeout)
+        connection.executescript(SCHEMA)
+        self.redirects = dict(connection.execute('SELECT url, final_url FROM redirects'))
+        connection.close()
+
+    def resolve(self, url):
+        """
+        The first URL in the redirect chain that isn't a shortener. If a
+        hop fails, resolution stops there and the caller's GET follows
+        the rest of the chain as usual.
+        """
+        hops = []
+
+        while is_shortener(url) and len(hops) < self.max_hops:
+            with self.lock:
+                final_url = self.redirects.get(url)
+
+                if final_url:
+                    self.stats['cached'] += 1
+
+            if final_url:
+                url = final_url
+                break
+
+            try:
+                resp = requests.head(url, allow_redirects=False, timeout=self.timeout)
+            except requests.exceptions.RequestException:
+                break
+
+            location = resp.headers.get('location')
+
+            if not resp.is_redirect or not location:
+                break
+
+            with self.lock:
+                self.stats['hops'] += 1
+
+            hops.append(url)
+            url = urljoin(url, location)
+
+        # Only remember chains that got somewhere real
+        if hops and not is_shortener(url):
+            with self.lock:
+                for hop in hops:
+                    self.redirects[hop] = url
+                    self.added[hop] = url
+
+        return url
+
+    def save(self):
+        connection = sqlite3.connect(self.path, timeout=self.lock_timeout)
+        connection.executescript(SCHEMA)
+
+        with connection:
+            connection.executemany('INSERT OR REPLACE INTO redirects (url, final_url) VALUES (?, ?)', self.added.items())
+
+        connection.close()
+
+        self.added = {}
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+Helpers for rendering tweets.
+"""
+
+ENTITY_TYPES = ('media', 'urls', 'hashtags', 'user_mentions', 'symbols')
+
+def entity_link(kind, entity):
+    """
+    Default HTML for a tweet entity: a plain link.
+    """
+    if kind in ('media', 'urls'):
+        return '<a href="%s">%s</a>' % (entity.get('expanded_url') or entity['url'], entity['display_url'])
+    elif kind == 'hashtags':
+        return '<a href="https://twitter.com/hashtag/%s">#%s</a>' % (entity['text'], entity['text'])
+    elif kind == 'user_mentions':
+        return '<a href="https://twitter.com/%s">@%s</a>' % (entity['screen_name'], entity['screen_name'])
+
+    return None
+
+def linkify(text, entities, render=entity_link):
+    """
+    Replace the entities in a tweet's text with HTML in a single pass.
+
+    Entities are placed by their `indices` rather than by searching for
+    their text, so an entity that is a substring of another (or appears
+    twice) is handled correctly. `render(kind, entity)` returns the HTML
+    for an entity, or None to leave its text alone. Overlapping entities
+    are skipped.
+    """
+    spans = []
+
+    for kind in ENTITY_TYPES:
+        for entity in entities.get(kind, []):
+            start, end = entity['indices']
+            spans.append((start, end, kind, entity))
+
+    spans.sort(key=lambda span: span[0])
+
+    html = []
+    position = 0
+
+    for start, end, kind, entity in spans:
+        if start < position:
+            continue
+
+        replacement = render(kind, entity)
+
+        if replacement is None:
+            continue
+
+        html.append(text[position:start])
+        html.append(replacement)
+        position = end
+
+    html.append(text[position:])
+
+    return u''.join(html)
+
+def linkify_tweet(tweet, render=entity_link):
+    """
+    Linkify a tweet from the Twitter API, in either the compatibility
+    (text) or extended (full_text) mode.
+    """
+    return linkify(tweet.get('full_text') or tweet['text'], tweet.get('entities', {}), render)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+"""
+A Twitter API wrapper that stays within Twitter's rate limits.
+
+Wraps a `twitter.Twitter` object, so calls look the same:
+
+    twitter_api = RateLimitedTwitter(Twitter(auth=...))
+    twitter_api.statuses.user_timeline(screen_name='nprviz')
+
+Each endpoint's budget is read from the x-rate-limit-* response headers.
+Calls are spaced out when the budget runs low, wait until the window
+resets when it's gone, and are retried after a 429.
+"""
+
+import threading
+import time
+
+from twitter import TwitterHTTPError
+
+class _Endpoint(object):
+    def __init__(self, client, parts):
+        self._client = client
+        self._parts = parts
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return _Endpoint(self._client, self._parts + (name,))
+
+    def __call__(self, **kwargs):
+        return self._client.call(self._parts, **kwargs)
+
+class RateLimitedTwitter(object):
+    """
+    `low_water` is the remaining budget below which calls are spread
+    evenly over the rest of the window rather than made immediately.
+    """
+    def __init__(self, api, low_water=3, max_retries=3, clock=time.time, sleep=time.sleep):
+        self.api = api
+        self.low_water = low_water
+        self.max_retries = max_retries
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.budgets = {}
+        self.stats = {
+            'calls': 0,
+            'throttled': 0,
+            'slept': 0
+        }
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return _Endpoint(self, (name,))
+
+    def _delay(self, resource):
+        """
+        How long to wait before calling `resource`, spending one call
+        of its budget if we know it.
+        """
+        with self.lock:
+            budget = self.budgets.get(resource)
+
+            if not budget:
+                return 0
+
+            now = self.clock()
+
+            if budget['reset'] <= now:
+                # New window; the next response will tell us the new budget
+                del self.budgets[resource]
+                return 0
+
+            # Calls left in this window, including this one
+            left = budget['remaining']
+            budget['remaining'] -= 1
+
+            if left <= 0:
+                # Wait for the reset, plus a second for clock skew
+                return budget['reset'] - now + 1
+
+            if left <= self.low_water:
+                # Space the calls left evenly so the last one lands
+                # before the reset rather than on it
+                return (budget['reset'] - now) / (left + 1.0)
+
+            return 0
+
+    def _update(self, resource, headers):
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+
+        if remaining is None or reset is None:
+            return
+
+        with self.lock:
+            self.budgets[resource] = {
+                'limit': int(headers.get('x-rate-limit-limit') or 0),
+                'remaining': int(remaining),
+                'reset': int(reset)
+            }
+
+    def _wait(self, seconds):
+        with self.lock:
+            self.stats['slept'] += seconds
+
+        self.sleep(seconds)
+
+    def call(self, parts, **kwargs):
+        resource = '/'.join(parts)
+        target = self.api
+
+        for part in parts:
+            target = getattr(target, part)
+
+        retries = 0
+
+        while True:
+            delay = self._delay(resource)
+
+            if delay > 0:
+                self._wait(delay)
+
+            with self.lock:
+                self.stats['calls'] += 1
+
+            try:
+                response = target(**kwargs)
+            except TwitterHTTPError as e:
+                if e.e.code != 429 or retries >= self.max_retries:
+                    raise
+
+                retries += 1
+
+                with self.lock:
+                    self.stats['throttled'] += 1
+
+                self._update(resource, e.e.headers)
+
+                with self.lock:
+                    budget = self.budgets.get(resource)
+                    wait = budget['reset'] - self.clock() + 1 if budget else 60
+
+                self._wait(max(wait, 1))
+                continue
+
+            self._update(resource, response.headers)
+
+            return response
+
+    def remaining(self, resource):
+        """
+        Calls left in the current window for an endpoint like
+        "statuses/user_timeline", or None if we don't know yet.
+        """
+        with self.lock:
+            budget = self.budgets.get(resource)
+
+            if budget and budget['reset'] > self.clock():
+                return max(budget['remaining'], 0)
+
+        return None
+
+    def report(self):
+        lines = ['Twitter API: %(calls)i calls, %(throttled)i rate limited, %(slept).1fs waiting' % self.stats]
+
+        now = self.clock()
+
+        for resource, budget in sorted(self.budgets.items()):
+            lines.append('    %s: %i of %i left, resets in %is' % (resource, max(budget['remaining'], 0), budget['limit'], max(budget['reset'] - now, 0)))
+
+        return lines
@@ -1,24 +1,23 @@
 #!/usr/bin/env python
 
-from email.parser import Parser
 from fabric.api import local, require, settings, task
 from fabric.state import env
 from jinja2 import Environment, FileSystemLoader
 from termcolor import colored
 from datetime import datetime
+import json
 
 import app_config
+from etc.bytecode_cache import jinja_bytecode_cache
 
 # Other fabfiles
 import assets
-import boto.ses
+import bench
 import data
 import flat
 import issues
 import os
-import pytumblr
 import render
-import smtplib
 import text
 import utils
 
@@ -43,7 +42,9 @@ env.settings = None
 
 env.tumblr_blog_name = 'stage-lookatthis'
 env.twitter_handle = 'lookatthisstory'
+env.linklater_jobs = None # list of {'twitter_handle', 'tumblr_blog_name'[, 'to_email_addresses']}, see linklater()
 env.twitter_timeframe = '7' # days
+env.prefetch_interval = 1800 # seconds between polls in prefetch(daemon=True)
 env.from_email_address = 'NPR Visuals Linklater <nprapps@npr.org>'
 env.to_email_addresses = ['sson@npr.org', 'deads@npr.org', 'coneill@npr.org']
 env.email_subject_template = 'Richard Linklater\'s links for %s'
@@ -51,7 +52,7 @@ env.email_subject_template = 'Richard Linklater\'s links for %s'
 # Jinja env
 fab_path = os.path.realpath(os.path.dirname(__file__))
 templates_path = os.path.join(fab_path, '../templates')
-env.jinja_env = Environment(loader=FileSystemLoader(templates_path))
+env.jinja_env = Environment(loader=FileSystemLoader(templates_path), bytecode_cache=jinja_bytecode_cache('fabfile'))
 
 """
 Environments
@@ -111,9 +112,10 @@ Running the app
 @task
 def app(port='8000'):
     """
-    Serve app.py.
+    Serve app.py, recompiling assets and reloading the browser when files change.
     """
-    local('gunicorn -b 0.0.0.0:%s --debug --reload app:wsgi_app' % port)
+    # Threads so the live reload event stream doesn't block the worker
+    local('DEV_WATCHER=1 gunicorn -b 0.0.0.0:%s --debug --reload --threads 4 app:wsgi_app' % port)
 
 @task
 def public_app(port='8001'):
@@ -166,45 +168,110 @@ def deploy(remote='origin'):
 
         servers.install_crontab()
 
+def _linklater_jobs(jobs_path=None):
+    """
+    The handle-to-blog pairs linklater should process. Read from a JSON
+    job spec if given, then env.linklater_jobs, falling back to the
+    single env.twitter_handle and env.tumblr_blog_name.
+    """
+    if jobs_path:
+        with open(jobs_path) as f:
+            return json.load(f)
+
+    if env.linklater_jobs:
+        return env.linklater_jobs
+
+    return [{
+        'twitter_handle': env.twitter_handle,
+        'tumblr_blog_name': env.tumblr_blog_name
+    }]
+
 @task
-def linklater():
+def linklater(jobs_path=None):
     """
-    Alerts recipients when Tumblr draft with links scraped from Twitter via fetch_tweets() is available.
+    Alerts recipients when Tumblr drafts with links scraped from Twitter via fetch_links() are available.
+
+    Pass the path to a JSON job spec to process several handles and blogs in one run:
+
+        [{"twitter_handle": "nprviz", "tumblr_blog_name": "lookatthis", "to_email_addresses": ["..."]}]
     """
+    import boto.ses
+
     now = datetime.now()
     print "%s: Running linklater" % now.isoformat()
 
-    response = deploy_to_tumblr()
+    jobs = _linklater_jobs(jobs_path)
+
+    links = data.fetch_links([job['twitter_handle'] for job in jobs], env.twitter_timeframe)
 
     template = env.jinja_env.get_template('notification_email.html')
+    subject = env.email_subject_template % now.strftime('%a, %b %d %Y')
+    connection = boto.ses.connect_to_region('us-east-1')
 
-    context = {
-        'blog_name': env.tumblr_blog_name,
-        'tumblr_post_id': response['id'],
-        'day_range': env.twitter_timeframe,
-        'twitter_handle': env.twitter_handle,
-        'richard_picture': 'http://assets.apps.npr.org/linklater/hippie_linklater.jpg'
-    }
+    for job in jobs:
+        response = deploy_to_tumblr(job['tumblr_blog_name'], links[job['twitter_handle']])
 
-    output = template.render(**context)
+        context = {
+            'blog_name': job['tumblr_blog_name'],
+            'tumblr_post_id': response['id'],
+            'day_range': env.twitter_timeframe,
+            'twitter_handle': job['twitter_handle'],
+            'richard_picture': 'http://assets.apps.npr.org/linklater/hippie_linklater.jpg'
+        }
 
-    subject = env.email_subject_template % now.strftime('%a, %b %d %Y')
+        output = template.render(**context)
 
-    connection = boto.ses.connect_to_region('us-east-1')
+        to_addresses = job.get('to_email_addresses', env.to_email_addresses)
 
-    try:
-        connection.send_email(
-            source=env.from_email_address,
-            subject=subject,
-            body=None,
-            html_body=output,
-            to_addresses=env.to_email_addresses
-        )
-    except boto.ses.exceptions.SESAddressNotVerifiedError as e:
-        print '%s: ERROR An email address has not been verified. Tried to send to %s' % (now.isoformat(), ', '.join(env.to_email_addresses))
+        try:
+            connection.send_email(
+                source=env.from_email_address,
+                subject=subject,
+                body=None,
+                html_body=output,
+                to_addresses=to_addresses
+            )
+        except boto.ses.exceptions.SESAddressNotVerifiedError as e:
+            print '%s: ERROR An email address has not been verified. Tried to send to %s' % (now.isoformat(), ', '.join(to_addresses))
+
+@task
+def prefetch(jobs_path=None, daemon=False):
+    """
+    Fetch new tweets and unfurl their links ahead of linklater.
+
+    Runs once (as the crontab does) unless daemon is set, in which case
+    it keeps polling every env.prefetch_interval seconds.
+    """
+    import time
+
+    # Fabric passes arguments as strings
+    daemon = daemon in (True, 'True', 'true', '1')
+    usernames = [job['twitter_handle'] for job in _linklater_jobs(jobs_path)]
+
+    while True:
+        print "%s: Prefetching links" % datetime.now().isoformat()
+
+        try:
+            data.prefetch_links(usernames, env.twitter_timeframe)
+        except Exception as e:
+            if not daemon:
+                raise
+
+            # Try again next time rather than dying
+            print '%s: ERROR %s' % (datetime.now().isoformat(), e)
+
+        if not daemon:
+            break
+
+        time.sleep(env.prefetch_interval)
 
 @task
-def deploy_to_tumblr():
+def deploy_to_tumblr(blog_name=None, links=None):
+    """
+    Post a Tumblr draft of links (by default, env.twitter_handle's to env.tumblr_blog_name).
+    """
+    import pytumblr
+
     now = datetime.now()
     secrets = app_config.get_secrets()
     tumblr_api = pytumblr.TumblrRestClient(
@@ -214,10 +281,12 @@ def deploy_to_tumblr():
             secrets['TUMBLR_TOKEN_SECRET']
         )
 
-    body = data.make_tumblr_draft_html()
+    blog_name = blog_name or env.tumblr_blog_name
+
+    body = data.make_tumblr_draft_html(links)
 
-    response = tumblr_api.create_text(env.tumblr_blog_name, state='draft', format='html', body=body.encode('utf8'))
-    print "%s: Created tumblr draft (id: %s)" % (now.isoformat(), response['id'])
+    response = tumblr_api.create_text(blog_name, state='draft', format='html', body=body.encode('utf8'))
+    print "%s: Created tumblr draft on %s (id: %s)" % (now.isoformat(), blog_name, response['id'])
 
     return response
 
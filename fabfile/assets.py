@@ -7,7 +7,6 @@ Commands related to the syncing assets.
 from glob import glob
 import os
 
-import boto
 from fabric.api import prompt, task
 import app_config
 from fnmatch import fnmatch
@@ -179,6 +178,8 @@ def _assets_get_bucket():
     """
     Get a reference to the assets bucket.
     """
+    import boto
+
     s3 = boto.connect_s3()
 
     return s3.get_bucket(app_config.ASSETS_S3_BUCKET['bucket_name'])
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+"""
+Commands for benchmarking the app and the linklater pipeline.
+
+Keep imports here light: this module is loaded by every fab command.
+"""
+
+import json
+import subprocess
+import sys
+import time
+import urllib
+
+from fabric.api import local, task
+
+# Modules whose cold import time we track
+STARTUP_MODULES = ['app', 'public_app', 'fabfile']
+
+def _median(values):
+    values = sorted(values)
+
+    return values[len(values) / 2]
+
+def _per_call(fn, values, rounds):
+    """
+    Median time in microseconds for one call of `fn` over `values`.
+    """
+    timings = []
+
+    for i in range(rounds):
+        start = time.time()
+
+        for value in values:
+            fn(value)
+
+        timings.append((time.time() - start) / len(values))
+
+    return _median(timings) * 1e6
+
+def _copy_strings():
+    """
+    Every cell value in the COPY spreadsheet.
+    """
+    from render_utils import load_copy
+
+    strings = []
+
+    for sheet in json.loads(load_copy().json()).values():
+        if isinstance(sheet, dict):
+            values = sheet.values()
+        else:
+            values = [value for row in sheet for value in row.values()]
+
+        strings.extend(unicode(value) for value in values if value is not None)
+
+    return strings
+
+def _legacy_linkify(tweet):
+    """
+    update_featured_social's original linkifier, which str.replace()d each
+    entity's text and so could mangle overlapping entities, for comparison.
+    """
+    from etc.tweets import entity_link
+
+    html = tweet['text']
+    subs = {}
+
+    for kind in ('media', 'urls', 'hashtags'):
+        for entity in tweet['entities'].get(kind, []):
+            original = tweet['text'][entity['indices'][0]:entity['indices'][1]]
+            subs[original] = entity_link(kind, entity)
+
+    for original, replacement in subs.items():
+        html = html.replace(original, replacement)
+
+    return html
+
+def _fake_tweet(i, entity_count):
+    """
+    A tweet with `entity_count` alternating hashtag and URL entities.
+    """
+    text = []
+    entities = { 'hashtags': [], 'urls': [] }
+    position = 0
+
+    for j in range(entity_count):
+        if j % 2:
+            word = 'http://t.co/%i%i' % (i, j)
+            entities['urls'].append({
+                'url': word,
+                'expanded_url': 'http://example.com/%i/%i' % (i, j),
+                'display_url': 'example.com/%i/%i' % (i, j),
+                'indices': [position, position + len(word)]
+            })
+        else:
+            word = '#tag%i' % j
+            entities['hashtags'].append({ 'text': word[1:], 'indices': [position, position + len(word)] })
+
+        text.append(word)
+        position += len(word) + 1
+
+    return { 'text': u' '.join(text), 'entities': entities }
+
+def _legacy_smarty(s):
+    """
+    The original smarty_filter, with its type() == 'Markup' check and UTF-8
+    round trip and without memoization, for comparison.
+    """
+    from flask import Markup
+    from smartypants import smartypants
+
+    if type(s) == 'Markup':
+        s = s.unescape()
+
+    if type(s) is not unicode:
+        s = unicode(s)
+
+    return Markup(smartypants(s.encode('utf-8')))
+
+def _legacy_urlencode(s):
+    """
+    The original urlencode_filter, with its type() == 'Markup' check and
+    without memoization, for comparison.
+    """
+    from flask import Markup
+
+    if type(s) == 'Markup':
+        s = s.unescape()
+
+    if type(s) is not unicode:
+        s = unicode(s)
+
+    return Markup(urllib.quote_plus(s.encode('utf8')))
+
+@task
+def imports(module='app', limit='20'):
+    """
+    Profile how long each import takes when loading a module.
+    """
+    local('%s etc/importtime.py %s %s' % (sys.executable, module, limit))
+
+@task
+def startup(runs='5'):
+    """
+    Measure cold-start import time of the app and fabfile in fresh interpreters.
+    """
+    baseline = []
+
+    for i in range(int(runs)):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', 'pass'])
+        baseline.append(time.time() - start)
+
+    baseline = _median(baseline)
+
+    for module in STARTUP_MODULES:
+        timings = []
+
+        for i in range(int(runs)):
+            start = time.time()
+            subprocess.check_call([sys.executable, '-c', 'import %s' % module])
+            timings.append(time.time() - start)
+
+        print '%-12s %8.1fms' % (module, (_median(timings) - baseline) * 1e3)
+
+@task
+def filters(rounds='20'):
+    """
+    Per-call cost of the smarty and urlencode filters over the COPY spreadsheet.
+    """
+    import render_utils
+
+    strings = _copy_strings()
+    ascii_strings = [s for s in strings if all(ord(c) < 128 for c in s)]
+
+    print '%i COPY strings (%i ASCII)' % (len(strings), len(ascii_strings))
+
+    # The old smarty filter can't handle non-ASCII copy at all
+    cases = [
+        ('smarty', 'legacy', _legacy_smarty, ascii_strings),
+        ('smarty', 'uncached', render_utils._smartypants, strings),
+        ('smarty', 'memoized', render_utils.smarty_filter, strings),
+        ('urlencode', 'legacy', _legacy_urlencode, strings),
+        ('urlencode', 'uncached', render_utils._urlencode, strings),
+        ('urlencode', 'memoized', render_utils.urlencode_filter, strings),
+    ]
+
+    for name, variant, fn, values in cases:
+        if values:
+            print '%-10s %-9s %8.2fus/call' % (name, variant, _per_call(fn, values, int(rounds)))
+
+    print render_utils.filter_cache_stats()
+
+@task
+def linkify(tweets='5000', entities='10', rounds='5'):
+    """
+    Per-tweet cost of linkifying a large batch of tweets.
+    """
+    from etc.tweets import linkify_tweet
+
+    batch = [_fake_tweet(i, int(entities)) for i in range(int(tweets))]
+
+    print '%s tweets with %s entities each' % (tweets, entities)
+
+    for variant, fn in (('legacy', _legacy_linkify), ('single-pass', linkify_tweet)):
+        print '%-12s %8.2fus/tweet' % (variant, _per_call(fn, batch, int(rounds)))
@@ -3,24 +3,46 @@
 """
 Commands that update or process the application data.
 """
+# Imported up front: datetime.strptime imports it lazily, which isn't
+# thread safe in Python 2 and fails in the timeline thread pool
+import _strptime
 from datetime import datetime
 import json
+from multiprocessing.pool import ThreadPool
+import time
+from urlparse import urljoin
 
-from bs4 import BeautifulSoup
-from flask import render_template
 from fabric.api import task
 from fabric.state import env
-from facebook import GraphAPI
-from twitter import Twitter, OAuth
-from jinja2 import Environment, FileSystemLoader
 
 import app_config
-import copytext
+from etc.archive import LinkArchive, week_of
+from etc.dedupe import MinHasher, normalize_url
+from etc.failures import NegativeCache
+from etc.hosts import HostLatencies, RateLimiter, interleave_by_host
+from etc.prefetch import PrefetchStore
+from etc.tweets import linkify_tweet
 import os
-import requests
 
 TWITTER_BATCH_SIZE = 200   
 
+# How long prefetched tweets and pages are kept
+PREFETCH_RETENTION_DAYS = 30
+
+# Links unfurled at once
+UNFURL_THREADS = 8
+
+# Seconds to wait for a page from a host we haven't timed yet
+UNFURL_TIMEOUT = 5
+
+# Requests per second to any one host, and how many may go at once
+HOST_RATE = 1
+HOST_BURST = 2
+
+# API endpoints, overridable to point at fakes in tests
+TWITTER_API_DOMAIN = 'api.twitter.com'
+FACEBOOK_GRAPH_URL = 'https://graph.facebook.com/'
+
 @task(default=True)
 def update():
     """
@@ -29,33 +51,248 @@ def update():
     #update_featured_social()
 
 @task
-def make_tumblr_draft_html():
-    links = fetch_tweets(env.twitter_handle, env.twitter_timeframe)
+def make_tumblr_draft_html(links=None):
+    """
+    Render the Tumblr draft for a set of links (by default, those
+    tweeted by env.twitter_handle).
+    """
+    if links is None:
+        links = fetch_tweets(env.twitter_handle, env.twitter_timeframe)
+
     template = env.jinja_env.get_template('tumblr.html')
     output = template.render(links=links)
     return output
 
-@task
-def fetch_tweets(username, days):
+def _twitter_api(secrets=None):
     """
-    Get tweets of a specific user
+    A Twitter API client that waits out rate limits rather than failing.
     """
-    current_time = datetime.now()    
+    from twitter import Twitter, OAuth
+    from etc.twitter_client import RateLimitedTwitter
 
-    secrets = app_config.get_secrets()
+    secrets = secrets or app_config.get_secrets()
 
-    twitter_api = Twitter(
+    return RateLimitedTwitter(Twitter(
         auth=OAuth(
             secrets['TWITTER_API_OAUTH_TOKEN'],
             secrets['TWITTER_API_OAUTH_SECRET'],
             secrets['TWITTER_API_CONSUMER_KEY'],
             secrets['TWITTER_API_CONSUMER_SECRET']
-        )
+        ),
+        domain=TWITTER_API_DOMAIN
+    ))
+
+@task
+def fetch_tweets(username, days):
+    """
+    Get tweets of a specific user
+    """
+    return fetch_links([username], days)[username]
+
+def fetch_links(usernames, days):
+    """
+    Get links tweeted by several users.
+
+    Picks up any tweets since the last prefetch (see prefetch_links)
+    and assembles links from the stored tweets and pages, so most of the
+    work has usually been done already.
+    Returns a dict of username to that user's links.
+    """
+    usernames = list(set(usernames))
+
+    store = PrefetchStore(app_config.LINK_ARCHIVE_PATH)
+    _prefetch(store, usernames, days)
+
+    archive = LinkArchive(app_config.LINK_ARCHIVE_PATH)
+    week = week_of()
+
+    links = {}
+
+    for username in usernames:
+        tweets = store.tweets(username, days)
+        urls = set()
+
+        for tweet in tweets:
+            urls.update(_tweet_urls(tweet))
+
+        unfurled = store.pages(urls)
+        out = []
+
+        for tweet in tweets:
+            out.extend(_process_tweet(tweet, username, unfurled))
+
+        links[username] = _dedupe_links(out, archive, week)
+
+    for link in sum(links.values(), []):
+        archive.add(link, week)
+
+    archive.close()
+    store.close()
+
+    return links
+
+def prefetch_links(usernames, days):
+    """
+    Fetch new tweets by several users and unfurl their links into the
+    link archive database, ready for fetch_links.
+    """
+    store = PrefetchStore(app_config.LINK_ARCHIVE_PATH)
+
+    _prefetch(store, list(set(usernames)), days)
+
+    store.prune(PREFETCH_RETENTION_DAYS)
+    store.close()
+
+def _thread_map(fn, items, threads):
+    """
+    map() over a pool of at most `threads` threads, and no more than
+    there are items.
+    """
+    items = list(items)
+
+    if not items:
+        return []
+
+    pool = ThreadPool(min(threads, len(items)))
+
+    try:
+        return pool.map(fn, items)
+    finally:
+        pool.close()
+        pool.join()
+
+def _prefetch(store, usernames, days):
+    """
+    Store tweets newer than the last one stored for each user (from the
+    last `days` days) and unfurl any of their links not already stored.
+    """
+    twitter_api = _twitter_api()
+    since_ids = [store.last_tweet_id(username) for username in usernames]
+
+    timelines = _thread_map(lambda args: _fetch_timeline(twitter_api, args[0], days, args[1]), zip(usernames, since_ids), len(usernames))
+
+    entities = {}
+
+    for username, tweets in zip(usernames, timelines):
+        store.add_tweets(username, tweets)
+
+        for tweet in store.tweets(username, days):
+            for entity in _tweet_url_entities(tweet):
+                entities[entity['expanded_url']] = entity
+
+    urls = sorted(set(entities) - set(store.pages(entities)))
+
+    print 'Fetched %i new tweets by %s' % (sum(len(tweets) for tweets in timelines), ', '.join(usernames))
+
+    for line in twitter_api.report():
+        print line
+
+    # Twitter often knows the title and description already, so only fetch
+    # what it doesn't: the <head> of the page if it's just missing an
+    # image, the whole page if it's missing more
+    from_twitter = {}
+
+    for url in urls:
+        data = _twitter_page(entities[url])
+
+        if data:
+            from_twitter[url] = data
+
+    need_image = [url for url in sorted(from_twitter) if not from_twitter[url].get('image')]
+    need_page = [url for url in urls if url not in from_twitter]
+
+    images = _unfurl([from_twitter[url]['url'] for url in need_image], ', '.join(usernames), head_only=True)
+
+    for url in need_image:
+        fetched = images.get(from_twitter[url]['url']) or {}
+
+        for field in ('image', 'description'):
+            if fetched.get(field) and not from_twitter[url].get(field):
+                from_twitter[url][field] = fetched[field]
+
+    print 'Twitter metadata: %i pages without fetching, %i with only a <head> fetch, %i fetched in full' % (
+        len(from_twitter) - len(need_image), len(need_image), len(need_page)
     )
 
+    store.add_pages(from_twitter)
+    store.add_pages(_unfurl(need_page, ', '.join(usernames)))
+
+def _unfurl(urls, tweeted_by, head_only=False):
+    """
+    Unfurl a list of tweeted URLs, returning a dict of URL to page data
+    (or None).
+
+    Short links are resolved with HEAD requests first, so every page is
+    unfurled once, no matter how many tweets or short links share it.
+    """
+    from etc import oembed
+    from etc.redirects import RedirectResolver
+
+    if not urls:
+        return {}
+
+    resolver = RedirectResolver(app_config.LINK_ARCHIVE_PATH, timeout=UNFURL_TIMEOUT)
+
+    resolved = dict(zip(urls, _thread_map(resolver.resolve, urls, UNFURL_THREADS)))
+
+    resolver.save()
+
+    archive = LinkArchive(app_config.LINK_ARCHIVE_PATH)
+    week = week_of()
+
+    # Fetch each page once, however many short links or tracking variants
+    # point at it, and not at all if it was posted in a previous week
+    pages = {}
+
+    for url in urls:
+        key = normalize_url(resolved[url])
+
+        if key not in pages:
+            posted = archive.seen_before({ 'url': resolved[url], 'canonical_url': key }, week)
+            pages[key] = None if posted else resolved[url]
+
+    archive.close()
+
+    page_urls = interleave_by_host(sorted(filter(None, pages.values())))
+
+    print 'Unfurling %i pages from %i links tweeted by %s' % (len(page_urls), len(urls), tweeted_by)
+
+    negative_cache = NegativeCache(app_config.LINK_ARCHIVE_PATH)
+    latencies = HostLatencies(app_config.LINK_ARCHIVE_PATH, default=UNFURL_TIMEOUT)
+    limiter = RateLimiter(HOST_RATE, HOST_BURST)
+    oembed_stats = oembed.UnfurlStats()
+
+    fetched = dict(zip(page_urls, _thread_map(lambda url: _grab_url(url, negative_cache, latencies, limiter, oembed_stats, head_only=head_only), page_urls, UNFURL_THREADS)))
+
+    negative_cache.save()
+    latencies.save()
+
+    print 'Short links: %(cached)i resolved from cache, %(hops)i HEAD requests' % resolver.stats
+
+    for line in oembed_stats.report() + negative_cache.report() + latencies.report():
+        print line
+
+    print 'Waited %.1fs in total for per-host rate limits' % limiter.waited
+
+    return dict((url, fetched.get(pages[normalize_url(resolved[url])])) for url in urls)
+
+def _fetch_timeline(twitter_api, username, days, since_id=None):
+    """
+    Get a user's tweets from the last `days` days, or just those newer
+    than `since_id`.
+    """
+    current_time = datetime.now()    
+
     out = []    
 
-    tweets = twitter_api.statuses.user_timeline(screen_name=username, count=TWITTER_BATCH_SIZE)
+    # Extended mode gets the full text and entities with any metadata
+    # Twitter has for the links (see _twitter_page)
+    kwargs = { 'tweet_mode': 'extended', 'include_entities': 'true' }
+
+    if since_id:
+        kwargs['since_id'] = since_id
+
+    tweets = twitter_api.statuses.user_timeline(screen_name=username, count=TWITTER_BATCH_SIZE, **kwargs)
 
     i = 0
 
@@ -72,30 +309,77 @@ def fetch_tweets(username, days):
         if time_difference > int(days):
             break     
 
-        out.extend(_process_tweet(tweet, username))
+        out.append(tweet)
 
         i += 1
 
         if i > (TWITTER_BATCH_SIZE-1):
-            tweets = twitter_api.statuses.user_timeline(screen_name=username, count=TWITTER_BATCH_SIZE, max_id=tweet['id'])
+            tweets = twitter_api.statuses.user_timeline(screen_name=username, count=TWITTER_BATCH_SIZE, max_id=tweet['id'], **kwargs)
             i = 0
 
-    out = _dedupe_links(out)
-
     return out
 
-def _process_tweet(tweet, username):
+def _tweet_url_entities(tweet):
+    """
+    The URL entities in a tweet worth unfurling.
+    """
+    return [
+        url for url in tweet['entities']['urls']
+        if not url['display_url'].startswith('pic.twitter.com')
+    ]
 
-    out = []
+def _tweet_urls(tweet):
+    """
+    The links in a tweet worth unfurling.
+    """
+    return [url['expanded_url'] for url in _tweet_url_entities(tweet)]
 
-    for url in tweet['entities']['urls']:
+def _twitter_page(entity):
+    """
+    Page data from the metadata Twitter attaches to a URL entity, in the
+    shape _grab_url returns, or None if it doesn't have a title.
 
-        if url['display_url'].startswith('pic.twitter.com'):
-            continue
+    Handles both the v1.1 "unwound" object and the flattened v2 fields
+    (unwound_url, title, description, images).
+    """
+    unwound = entity.get('unwound') or {}
+
+    title = unwound.get('title') or entity.get('title')
+    status = unwound.get('status') or entity.get('status')
+
+    if not title or (status and int(status) != 200):
+        return None
+
+    url = unwound.get('url') or entity.get('unwound_url') or entity['expanded_url']
+
+    data = {
+        'url': url,
+        'canonical_url': normalize_url(url),
+        'title': title
+    }
+
+    description = unwound.get('description') or entity.get('description')
+
+    if description:
+        data['description'] = description
+
+    if entity.get('images'):
+        # Largest first
+        data['image'] = entity['images'][0]['url']
+
+    return data
+
+def _process_tweet(tweet, username, unfurled):
 
-        row = _grab_url(url['expanded_url'])
-        if row:
-            row['tweet_text'] = tweet['text']
+    out = []
+
+    for url in _tweet_urls(tweet):
+
+        data = unfurled.get(url)
+        if data:
+            row = dict(data)
+            row['tweet_text'] = tweet.get('full_text') or tweet['text']
+            row['tweet_html'] = linkify_tweet(tweet)
             if tweet.get('retweeted_status'):
                 row['tweet_url'] = 'http://twitter.com/%s/status/%s' % (tweet['retweeted_status']['user']['screen_name'], tweet['id'])
                 row['tweeted_by'] = tweet['retweeted_status']['user']['screen_name']
@@ -106,34 +390,101 @@ def _process_tweet(tweet, username):
 
     return out 
 
-def _grab_url(url):
+def _grab_url(url, negative_cache=None, latencies=None, limiter=None, oembed_stats=None, head_only=False):
     """
+    Unfurl a URL, skipping it if it failed recently according to
+    `negative_cache`. The timeout comes from the host's observed
+    `latencies` and requests are paced by the per-host `limiter`.
+    With `head_only`, stop downloading at the end of the <head>.
+    Media hosts with an oEmbed provider (see etc/oembed.py) are asked
+    for that instead of having their pages scraped, counted in
+    `oembed_stats`. If that fails, the page gets what's left of the
+    timeout, and a failing endpoint is skipped until its host recovers.
+
     Returns data of the form:
     {
+        'url': <FINAL_URL>,
+        'canonical_url': <CANONICAL_URL>,
         'title': <TITLE>,
         'description': <DESCRIPTION>,
         'type': <page/image/download>,
         'image': <IMAGE_URL>,
         'tweet_url': <TWEET_URL>.
         'tweet_text': <TWEET_TEXT>,
+        'tweet_html': <LINKIFIED_TWEET_TEXT>,
         'tweeted_by': <USERNAME>
     }
     """
+    from bs4 import BeautifulSoup
+    from etc import oembed
+    import requests
+
     data = None
+    timeout = latencies.timeout(url) if latencies else UNFURL_TIMEOUT
+
+    if negative_cache:
+        reason = negative_cache.blocked(url)
+
+        if reason:
+            print '%s failed recently (%s), skipping' % (url, reason)
+            return None
+
+    provider, match = oembed.registry.provider_for(url)
+
+    # Go straight to the page while a provider's endpoint is failing
+    if provider and not (negative_cache and negative_cache.host_penalized(provider.endpoint)):
+        if limiter:
+            limiter.wait(provider.endpoint)
+
+        start = time.time()
+        data = oembed.registry.unfurl(url, timeout=timeout, stats=oembed_stats, negative_cache=negative_cache)
+
+        if data:
+            if negative_cache:
+                negative_cache.succeeded(url)
+
+            return data
+
+        # The page only gets what the oEmbed request left of the timeout
+        timeout -= time.time() - start
+
+        if timeout <= 0:
+            print '%s timed out asking %s.' % (url, provider.name)
+            return None
+
+    if limiter:
+        limiter.wait(url)
 
     try:
-        resp = requests.get(url, timeout=5)
+        resp = requests.get(url, timeout=timeout, stream=head_only)
     except requests.exceptions.Timeout:
         print '%s timed out.' % url
+
+        if latencies:
+            latencies.timed_out(url, timeout)
+
+        if negative_cache:
+            negative_cache.failed(url, 'timeout')
+
+        return None
+    except requests.exceptions.ConnectionError:
+        print 'Could not connect to %s.' % url
+
+        if negative_cache:
+            negative_cache.failed(url, 'connection error')
+
         return None
 
     real_url = resp.url
 
-    if resp.status_code == 200 and resp.headers.get('content-type').startswith('text/html'):
+    if latencies:
+        latencies.record(url, resp.elapsed.total_seconds())
+
+    if resp.status_code == 200 and resp.headers.get('content-type', '').startswith('text/html'):
         data = {}
         data['url'] = real_url
 
-        soup = BeautifulSoup(resp.content)
+        soup = BeautifulSoup(_read_head(resp) if head_only else resp.content)
 
         og_tags = ('image', 'title', 'description')
         for og_tag in og_tags:
@@ -141,132 +492,217 @@ def _grab_url(url):
             if match and match.attrs.get('content'):
                 data[og_tag] = match.attrs.get('content')
 
+        # The same story is often reachable from AMP, mobile or syndicated URLs
+        canonical = soup.find('link', rel='canonical')
+        og_url = soup.find(attrs={'property': 'og:url'})
+
+        if canonical and canonical.attrs.get('href'):
+            canonical_url = canonical.attrs['href']
+        elif og_url and og_url.attrs.get('content'):
+            canonical_url = og_url.attrs['content']
+        else:
+            canonical_url = real_url
+
+        data['canonical_url'] = normalize_url(urljoin(real_url, canonical_url))
+
+        if negative_cache:
+            negative_cache.succeeded(url)
+
     else:
+        # A streamed response holds its connection until it's closed
+        resp.close()
+
         print "There was an error accessing %s (%s)" % (real_url, resp.status_code)
 
+        # Only server errors count against the whole host
+        if negative_cache:
+            negative_cache.failed(url, 'HTTP %s' % resp.status_code, host_failure=resp.status_code >= 500)
+
     return data
 
-def _dedupe_links(links):
+def _read_head(resp, limit=256 * 1024):
+    """
+    Read a streamed response up to the end of its <head>, where the og
+    tags are, and drop the connection.
+    """
+    content = ''
+
+    try:
+        for chunk in resp.iter_content(8192):
+            content += chunk
+
+            if '</head>' in content[-len(chunk) - 7:].lower() or len(content) >= limit:
+                break
+    finally:
+        resp.close()
+
+    return content
+
+def _dedupe_links(links, archive=None, week=None):
     """
-    Get rid of duplicate URLs
+    Get rid of duplicate URLs (by canonical URL where we know it), links
+    already posted in a previous week if given the link archive, and
+    links whose title and description are near-duplicates of another's.
     """
     out = []
-    urls_seen = []
+    urls_seen = set()
     for link in links:
-        if link['url'] not in urls_seen:
-            urls_seen.append(link['url'])
-            out.append(link)
-        else:
+        url = link.get('canonical_url') or normalize_url(link['url'])
+
+        if url in urls_seen:
             print "%s is a duplicate, skipping" % link['url']
+        elif archive and archive.seen_before(link, week):
+            print "%s was posted in a previous week, skipping" % link['url']
+        else:
+            urls_seen.add(url)
+            out.append(link)
 
-    return out
+    texts = [u'%s %s' % (link.get('title') or '', link.get('description') or '') for link in out]
+    duplicates = set(MinHasher().duplicates(texts))
+
+    for i in sorted(duplicates):
+        print "%s is a near-duplicate, skipping" % out[i]['url']
+
+    return [link for i, link in enumerate(out) if i not in duplicates]
 
 @task
-def update_featured_social():
+def search_links(query, limit='20'):
     """
-    Update featured tweets
+    Search the archive of previously unfurled links.
     """
-    COPY = copytext.Copy(app_config.COPY_PATH)
-    secrets = app_config.get_secrets()
+    archive = LinkArchive(app_config.LINK_ARCHIVE_PATH)
 
-    # Twitter
-    print 'Fetching tweets...'
+    for link in archive.search(query, int(limit)):
+        print '%s  %s' % (link['week'], link['url'])
+        print '          %s' % (link['title'] or '')
 
-    twitter_api = Twitter(
-        auth=OAuth(
-            secrets['TWITTER_API_OAUTH_TOKEN'],
-            secrets['TWITTER_API_OAUTH_SECRET'],
-            secrets['TWITTER_API_CONSUMER_KEY'],
-            secrets['TWITTER_API_CONSUMER_SECRET']
-        )
-    )
+    archive.close()
+
+def _featured_ids(COPY, key):
+    """
+    Ids of the featured tweets or posts linked in the share sheet.
+    """
+    import copytext
 
-    tweets = []
+    ids = []
 
     for i in range(1, 4):
-        tweet_url = COPY['share']['featured_tweet%i' % i]
+        url = COPY['share']['%s%i' % (key, i)]
 
-        if isinstance(tweet_url, copytext.Error) or unicode(tweet_url).strip() == '':
+        if isinstance(url, copytext.Error) or unicode(url).strip() == '':
             continue
 
-        tweet_id = unicode(tweet_url).split('/')[-1]
+        ids.append(unicode(url).split('/')[-1])
 
-        tweet = twitter_api.statuses.show(id=tweet_id)
+    return ids
 
-        creation_date = datetime.strptime(tweet['created_at'],'%a %b %d %H:%M:%S +0000 %Y')
-        creation_date = '%s %i' % (creation_date.strftime('%b'), creation_date.day)
+def _format_featured_tweet(tweet):
+    """
+    Reduce a tweet to the fields featured.json needs.
+    """
+    creation_date = datetime.strptime(tweet['created_at'],'%a %b %d %H:%M:%S +0000 %Y')
+    creation_date = '%s %i' % (creation_date.strftime('%b'), creation_date.day)
+
+    tweet_url = 'http://twitter.com/%s/status/%s' % (tweet['user']['screen_name'], tweet['id'])
+
+    photo = None
+
+    for media in tweet['entities'].get('media', []):
+        if media['type'] == 'photo':
+            photo = {
+                'url': media['media_url']
+            }
+
+            break
 
-        tweet_url = 'http://twitter.com/%s/status/%s' % (tweet['user']['screen_name'], tweet['id'])
+    def render(kind, entity):
+        if kind in ('media', 'urls'):
+            return '<a href="%s" target="_blank" onclick="_gaq.push([\'_trackEvent\', \'%s\', \'featured-tweet-action\', \'link\', 0, \'%s\']);">%s</a>' % (entity['url'], app_config.PROJECT_SLUG, tweet_url, entity['display_url'])
+        elif kind == 'hashtags':
+            return '<a href="https://twitter.com/hashtag/%s" target="_blank" onclick="_gaq.push([\'_trackEvent\', \'%s\', \'featured-tweet-action\', \'hashtag\', 0, \'%s\']);">%s</a>' % (entity['text'], app_config.PROJECT_SLUG, tweet_url, '#%s' % entity['text'])
 
-        photo = None
-        html = tweet['text']
-        subs = {}
+        return None
 
-        for media in tweet['entities'].get('media', []):
-            original = tweet['text'][media['indices'][0]:media['indices'][1]]
-            replacement = '<a href="%s" target="_blank" onclick="_gaq.push([\'_trackEvent\', \'%s\', \'featured-tweet-action\', \'link\', 0, \'%s\']);">%s</a>' % (media['url'], app_config.PROJECT_SLUG, tweet_url, media['display_url'])
+    html = linkify_tweet(tweet, render)
+
+    # https://dev.twitter.com/docs/api/1.1/get/statuses/show/%3Aid
+    return {
+        'id': tweet['id'],
+        'url': tweet_url,
+        'html': html,
+        'favorite_count': tweet['favorite_count'],
+        'retweet_count': tweet['retweet_count'],
+        'user': {
+            'id': tweet['user']['id'],
+            'name': tweet['user']['name'],
+            'screen_name': tweet['user']['screen_name'],
+            'profile_image_url': tweet['user']['profile_image_url'],
+            'url': tweet['user']['url'],
+        },
+        'creation_date': creation_date,
+        'photo': photo
+    }
 
-            subs[original] = replacement
+def _fetch_featured_tweets(secrets, tweet_ids):
+    """
+    Fetch featured tweets with a single statuses/lookup call.
+    """
+    if not tweet_ids:
+        return []
 
-            if media['type'] == 'photo' and not photo:
-                photo = {
-                    'url': media['media_url']
-                }
+    twitter_api = _twitter_api(secrets)
 
-        for url in tweet['entities'].get('urls', []):
-            original = tweet['text'][url['indices'][0]:url['indices'][1]]
-            replacement = '<a href="%s" target="_blank" onclick="_gaq.push([\'_trackEvent\', \'%s\', \'featured-tweet-action\', \'link\', 0, \'%s\']);">%s</a>' % (url['url'], app_config.PROJECT_SLUG, tweet_url, url['display_url'])
+    # "_id" is sent as the "id" parameter rather than appended to the URL,
+    # and the library would POST anything called "lookup"
+    tweets = twitter_api.statuses.lookup(_id=','.join(tweet_ids), _method='GET')
 
-            subs[original] = replacement
+    # Lookup doesn't preserve order and silently drops deleted tweets
+    tweets = dict((tweet['id_str'], tweet) for tweet in tweets)
 
-        for hashtag in tweet['entities'].get('hashtags', []):
-            original = tweet['text'][hashtag['indices'][0]:hashtag['indices'][1]]
-            replacement = '<a href="https://twitter.com/hashtag/%s" target="_blank" onclick="_gaq.push([\'_trackEvent\', \'%s\', \'featured-tweet-action\', \'hashtag\', 0, \'%s\']);">%s</a>' % (hashtag['text'], app_config.PROJECT_SLUG, tweet_url, '#%s' % hashtag['text'])
+    return [_format_featured_tweet(tweets[tweet_id]) for tweet_id in tweet_ids if tweet_id in tweets]
 
-            subs[original] = replacement
+def _fetch_featured_facebook_posts(secrets, post_ids):
+    """
+    Fetch featured Facebook posts, their authors and their like and
+    comment counts with a single Graph API batch request.
+    """
+    import requests
 
-        for original, replacement in subs.items():
-            html =  html.replace(original, replacement)
+    if not post_ids:
+        return []
 
-        # https://dev.twitter.com/docs/api/1.1/get/statuses/show/%3Aid
-        tweets.append({
-            'id': tweet['id'],
-            'url': tweet_url,
-            'html': html,
-            'favorite_count': tweet['favorite_count'],
-            'retweet_count': tweet['retweet_count'],
-            'user': {
-                'id': tweet['user']['id'],
-                'name': tweet['user']['name'],
-                'screen_name': tweet['user']['screen_name'],
-                'profile_image_url': tweet['user']['profile_image_url'],
-                'url': tweet['user']['url'],
-            },
-            'creation_date': creation_date,
-            'photo': photo
-        })
+    # https://developers.facebook.com/docs/graph-api/making-multiple-requests
+    batch = []
+
+    for i, post_id in enumerate(post_ids):
+        name = 'post%i' % i
+
+        batch.extend([
+            { 'method': 'GET', 'name': name, 'relative_url': post_id, 'omit_response_on_success': False },
+            { 'method': 'GET', 'relative_url': '{result=%s:$.from.id}' % name },
+            { 'method': 'GET', 'relative_url': '{result=%s:$.from.id}/picture?redirect=false' % name },
+            { 'method': 'GET', 'relative_url': '%s/likes?summary=true' % post_id },
+            { 'method': 'GET', 'relative_url': '%s/comments?summary=true' % post_id }
+        ])
 
-    # Facebook
-    print 'Fetching Facebook posts...'
+    resp = requests.post(FACEBOOK_GRAPH_URL, data={
+        'access_token': secrets['FACEBOOK_API_APP_TOKEN'],
+        'batch': json.dumps(batch)
+    })
 
-    fb_api = GraphAPI(secrets['FACEBOOK_API_APP_TOKEN'])
+    resp.raise_for_status()
 
+    responses = resp.json()
     facebook_posts = []
 
-    for i in range(1, 4):
-        fb_url = COPY['share']['featured_facebook%i' % i]
+    for i, post_id in enumerate(post_ids):
+        results = responses[i * 5:(i + 1) * 5]
 
-        if isinstance(fb_url, copytext.Error) or unicode(fb_url).strip() == '':
+        if not all(result and result['code'] == 200 for result in results):
+            print 'There was an error fetching Facebook post %s' % post_id
             continue
 
-        fb_id = unicode(fb_url).split('/')[-1]
-
-        post = fb_api.get_object(fb_id)
-        user  = fb_api.get_object(post['from']['id'])
-        user_picture = fb_api.get_object('%s/picture' % post['from']['id'])
-        likes = fb_api.get_object('%s/likes' % fb_id, summary='true')
-        comments = fb_api.get_object('%s/comments' % fb_id, summary='true')
-        #shares = fb_api.get_object('%s/sharedposts' % fb_id)
+        post, user, user_picture, likes, comments = [json.loads(result['body']) for result in results]
 
         creation_date = datetime.strptime(post['created_time'],'%Y-%m-%dT%H:%M:%S+0000')
         creation_date = '%s %i' % (creation_date.strftime('%b'), creation_date.day)
@@ -285,19 +721,41 @@ def update_featured_social():
             'from': {
                 'name': user['name'],
                 'link': user['link'],
-                'picture': user_picture['url']
+                'picture': user_picture['data']['url']
             },
             'likes': likes['summary']['total_count'],
             'comments': comments['summary']['total_count'],
-            #'shares': shares['summary']['total_count'],
             'creation_date': creation_date
         })
 
+    return facebook_posts
+
+@task
+def update_featured_social():
+    """
+    Update featured tweets and Facebook posts, fetching both at once.
+    """
+    from render_utils import load_copy
+
+    COPY = load_copy()
+    secrets = app_config.get_secrets()
+
+    print 'Fetching tweets and Facebook posts...'
+
+    pool = ThreadPool(2)
+
+    tweets = pool.apply_async(_fetch_featured_tweets, (secrets, _featured_ids(COPY, 'featured_tweet')))
+    facebook_posts = pool.apply_async(_fetch_featured_facebook_posts, (secrets, _featured_ids(COPY, 'featured_facebook')))
+
+    pool.close()
+
     # Render to JSON
     output = {
-        'tweets': tweets,
-        'facebook_posts': facebook_posts
+        'tweets': tweets.get(),
+        'facebook_posts': facebook_posts.get()
     }
 
+    pool.join()
+
     with open('data/featured.json', 'w') as f:
         json.dump(output, f)
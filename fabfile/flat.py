@@ -7,9 +7,6 @@ import hashlib
 import mimetypes
 import os
 
-import boto
-from boto.s3.key import Key
-
 import app_config
 
 GZIP_FILE_TYPES = ['.html', '.js', '.json', '.css', '.xml']
@@ -26,6 +23,8 @@ def deploy_file(connection, src, dst, max_age):
     """
     Deploy a single file to S3, if the local version is different.
     """
+    from boto.s3.key import Key
+
     bucket = connection.get_bucket(app_config.S3_BUCKET['bucket_name'])
     
     k = bucket.get_key(dst)
@@ -108,6 +107,8 @@ def deploy_folder(src, dst, max_age=app_config.DEFAULT_MAX_AGE, ignore=[]):
 
             to_deploy.append((src_path, dst_path))
 
+    import boto
+
     s3 = boto.connect_s3() 
 
     for src, dst in to_deploy:
@@ -117,6 +118,8 @@ def delete_folder(dst):
     """
     Delete a folder from S3.
     """
+    import boto
+
     s3 = boto.connect_s3() 
     
     bucket = s3.get_bucket(app_config.S3_BUCKET['bucket_name'])
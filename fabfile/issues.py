@@ -7,13 +7,14 @@ Commands that integrate with Github issues.
 from fabric.api import task
 
 import app_config
-from etc import github
 
 @task
 def bootstrap():
     """
     Bootstraps Github issues with default configuration.
     """
+    from etc import github
+
     if app_config.PROJECT_SLUG == '$NEW_PROJECT_SLUG':
         print 'You can\'t run the issues bootstrap until you\'ve set PROJECT_SLUG in app_config.py!'
         return
@@ -30,6 +31,8 @@ def from_file(path):
     """
     Import a list of a issues from any CSV formatted like default_tickets.csv.
     """
+    from etc import github
+
     auth = github.get_auth()
     github.create_tickets(auth, path)
 
@@ -5,16 +5,22 @@ Commands for rendering various parts of the app stack.
 """
 
 from glob import glob
+from importlib import import_module
+import json
 import os
 
-from fabric.api import local, task
+from fabric.api import abort, local, task
 
-import app
+import app_config
+
+# NB: app is imported inside each task so other fab commands don't pay for it
 
 def _fake_context(path):
     """
     Create a fact request context for a given path.
     """
+    import app
+
     return app.app.test_request_context(path=path)
 
 def _view_from_name(name):
@@ -30,7 +36,7 @@ def _view_from_name(name):
     else:
         module = 'app'
 
-    return globals()[module].__dict__[name]
+    return import_module(module).__dict__[name]
 
 @task
 def less():
@@ -91,53 +97,84 @@ def render_all():
     """
     from flask import g
 
+    import app
+    import render_utils
+
     less()
     jst()
     app_config_js()
     copytext_js()
 
     compiled_includes = {} 
+    bundle_reports = {}
+
+    # Loop over all views in the app, sharing one minifier pool
+    with render_utils.compress_pool() as pool:
+        for rule in app.app.url_map.iter_rules():
+            rule_string = rule.rule
+            name = rule.endpoint
+
+            # Skip utility views
+            if name == 'static' or name.startswith('_'):
+                print 'Skipping %s' % name
+                continue
+
+            # Convert trailing slashes to index.html files
+            if rule_string.endswith('/'):
+                filename = 'www' + rule_string + 'index.html'
+            elif rule_string.endswith('.html'):
+                filename = 'www' + rule_string
+            else:
+                print 'Skipping %s' % name
+                continue
 
-    # Loop over all views in the app
-    for rule in app.app.url_map.iter_rules():
-        rule_string = rule.rule
-        name = rule.endpoint
+            # Create the output path
+            dirname = os.path.dirname(filename)
 
-        # Skip utility views
-        if name == 'static' or name.startswith('_'):
-            print 'Skipping %s' % name
-            continue
+            if not (os.path.exists(dirname)):
+                os.makedirs(dirname)
 
-        # Convert trailing slashes to index.html files
-        if rule_string.endswith('/'):
-            filename = 'www' + rule_string + 'index.html'
-        elif rule_string.endswith('.html'):
-            filename = 'www' + rule_string
-        else:
-            print 'Skipping %s' % name
-            continue
+            print 'Rendering %s' % (filename)
 
-        # Create the output path
-        dirname = os.path.dirname(filename)
+            # Render views, reusing compiled assets
+            with _fake_context(rule_string):
+                g.compile_includes = True
+                g.compiled_includes = compiled_includes
+                g.bundle_reports = bundle_reports
+                g.compress_pool = pool
 
-        if not (os.path.exists(dirname)):
-            os.makedirs(dirname)
+                view = _view_from_name(name)
 
-        print 'Rendering %s' % (filename)
+                content = view().data
+
+                compiled_includes = g.compiled_includes
+
+            # Write rendered view
+            # NB: Flask response object has utf-8 encoded the data
+            with open(filename, 'w') as f:
+                f.write(content)
+
+    _check_bundles(bundle_reports)
+
+def _check_bundles(bundle_reports):
+    """
+    Write the bundle size report and fail if any bundle is over budget.
+    """
+    with open(app_config.BUNDLE_REPORT_PATH, 'w') as f:
+        json.dump(bundle_reports, f, indent=4, sort_keys=True)
 
-        # Render views, reusing compiled assets
-        with _fake_context(rule_string):
-            g.compile_includes = True
-            g.compiled_includes = compiled_includes
+    print 'Wrote bundle report to %s' % app_config.BUNDLE_REPORT_PATH
 
-            view = _view_from_name(name)
+    over_budget = []
 
-            content = view().data
+    for path, report in sorted(bundle_reports.items()):
+        print '%s: %i bytes minified, %i bytes gzipped' % (path, report['minified_size'], report['gzip_size'])
 
-            compiled_includes = g.compiled_includes
+        for item in sorted(report['inputs'], key=lambda i: -i['gzip_size']):
+            print '    %-40s %8i raw %8i min %8i gz %6.2fs' % (item['path'], item['raw_size'], item['minified_size'], item['gzip_size'], item['minify_time'])
 
-        # Write rendered view
-        # NB: Flask response object has utf-8 encoded the data
-        with open(filename, 'w') as f:
-            f.write(content)
+        if app_config.BUNDLE_GZIP_BUDGET and report['gzip_size'] > app_config.BUNDLE_GZIP_BUDGET:
+            over_budget.append(path)
 
+    if over_budget:
+        abort('%s over the %i byte gzipped budget (BUNDLE_GZIP_BUDGET)' % (', '.join(over_budget), app_config.BUNDLE_GZIP_BUDGET))
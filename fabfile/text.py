@@ -8,13 +8,15 @@ from fabric.api import task
 from termcolor import colored
 
 import app_config
-from etc.gdocs import GoogleDoc
 
 @task(default=True)
 def update():
     """
-    Downloads a Google Doc as an Excel file.
+    Downloads a Google Doc as an Excel file and snapshots the parsed copy.
     """
+    from etc.gdocs import GoogleDoc
+    from render_utils import write_copy_snapshot
+
     if app_config.COPY_GOOGLE_DOC_URL == None:
         print colored('You have set COPY_GOOGLE_DOC_URL to None. If you want to use a Google Sheet, set COPY_GOOGLE_DOC_URL to the URL of your sheet in app_config.py', 'blue')
         return
@@ -29,3 +31,6 @@ def update():
         g.get_auth()
         g.get_document()
 
+        print 'Writing copy snapshot to %s' % app_config.COPY_SNAPSHOT_PATH
+        write_copy_snapshot()
+
@@ -8,7 +8,8 @@ from flask import Flask, make_response, render_template
 from werkzeug.debug import DebuggedApplication
 
 import app_config
-from render_utils import make_context, smarty_filter, urlencode_filter
+from etc.bytecode_cache import jinja_bytecode_cache
+from render_utils import cache_page, make_context, preload_templates, smarty_filter, urlencode_filter
 import static
 
 app = Flask(__name__)
@@ -24,6 +25,8 @@ app.register_blueprint(static.static, url_prefix='/%s' % app_config.PROJECT_SLUG
 app.add_template_filter(smarty_filter, name='smarty')
 app.add_template_filter(urlencode_filter, name='urlencode')
 
+app.jinja_env.bytecode_cache = jinja_bytecode_cache('public_app')
+
 # Example application views
 @app.route('/%s/test/' % app_config.PROJECT_SLUG, methods=['GET'])
 def _test_app():
@@ -36,6 +39,7 @@ def _test_app():
 
 # Example of rendering index.html with public_app 
 @app.route ('/%s/' % app_config.PROJECT_SLUG, methods=['GET'])
+@cache_page('data/featured.json')
 def index():
     """
     Example view rendering a simple page.
@@ -47,6 +51,8 @@ def index():
 
     return make_response(render_template('index.html', **context))
 
+preload_templates(app.jinja_env)
+
 # Enable Werkzeug debug pages
 if app_config.DEBUG:
     wsgi_app = DebuggedApplication(app, evalex=False)
@@ -1,14 +1,23 @@
 #!/usr/bin/env python
 
 import codecs
+from collections import OrderedDict
+from contextlib import contextmanager
+import cPickle as pickle
+from cStringIO import StringIO
 from datetime import datetime
+from functools import wraps
+import gzip
+import hashlib
 import json
+from multiprocessing import Pool, cpu_count
+import os
+import threading
 import time
 import urllib
 
-from cssmin import cssmin
-from flask import Markup, g, render_template, request
-from slimit import minify
+from flask import Markup, current_app, g, render_template, request
+from jinja2 import TemplateSyntaxError
 from smartypants import smartypants
 
 import app_config
@@ -35,6 +44,7 @@ class Includer(object):
     def __init__(self, asset_depth=0):
         self.includes = []
         self.tag_string = None
+        self.map_comment = None
         self.asset_depth = asset_depth
 
     def push(self, path):
@@ -42,9 +52,60 @@ class Includer(object):
 
         return ''
 
-    def _compress(self):
+    def _compress(self, out_path):
         raise NotImplementedError()
 
+    def _bundle(self, out_path, header, results):
+        """
+        Join a header and minified files into a bundle, write its source
+        map and record a size report for "fab render".
+
+        Minifiers don't emit mappings of their own, so the map resolves
+        each line of the bundle to the file it came from.
+        """
+        out_dir = os.path.dirname(out_path)
+        map_path = '%s.map' % out_path
+
+        sources = []
+        lines = [''] * len(header.split('\n'))
+        chunks = [header]
+
+        for i, result in enumerate(results):
+            sources.append(os.path.relpath(result['path'], out_dir))
+
+            for j in range(len(result['output'].split('\n'))):
+                # Line 0, column 0 of source i; later segments are deltas
+                lines.append('AAAA' if j else 'A%sAA' % _vlq(1 if i else 0))
+
+            chunks.append(result['output'])
+
+        chunks.append(self.map_comment % os.path.basename(map_path))
+        bundle = '\n'.join(chunks)
+
+        with open(map_path, 'w') as f:
+            json.dump({
+                'version': 3,
+                'file': os.path.basename(out_path),
+                'sources': sources,
+                'names': [],
+                'mappings': ';'.join(lines)
+            }, f)
+
+        reports = getattr(g, 'bundle_reports', None)
+
+        if reports is not None:
+            encoded = bundle.encode('utf-8')
+
+            reports[out_path] = {
+                'minified_size': len(encoded),
+                'gzip_size': _gzip_size(encoded),
+                'inputs': [
+                    dict((k, v) for k, v in result.items() if k != 'output') for result in results
+                ]
+            }
+
+        return bundle
+
     def _relativize_path(self, path):
         relative_path = path
         depth = len(request.path.split('/')) - (2 + self.asset_depth) 
@@ -69,7 +130,7 @@ class Includer(object):
                     print 'Rendering %s' % out_path
 
                     with codecs.open(out_path, 'w', encoding='utf-8') as f:
-                        f.write(self._compress())
+                        f.write(self._compress(out_path))
 
                 # See "fab render"
                 g.compiled_includes[path] = timestamp_path
@@ -96,25 +157,19 @@ class JavascriptIncluder(Includer):
         Includer.__init__(self, *args, **kwargs)
 
         self.tag_string = '<script type="text/javascript" src="%s"></script>'
+        self.map_comment = '//# sourceMappingURL=%s'
 
-    def _compress(self):
-        output = []
-        src_paths = []
-
-        for src in self.includes:
-            src_paths.append('www/%s' % src)
+    def _compress(self, out_path):
+        src_paths = ['www/%s' % src for src in self.includes]
 
-            with codecs.open('www/%s' % src, encoding='utf-8') as f:
-                print '- compressing %s' % src
-                output.append(minify(f.read()))
+        output = _parallel_map(_minify_js, src_paths)
 
         context = make_context()
         context['paths'] = src_paths
 
         header = render_template('_js_header.js', **context)
-        output.insert(0, header)
 
-        return '\n'.join(output)
+        return self._bundle(out_path, header, output)
 
 class CSSIncluder(Includer):
     """
@@ -124,11 +179,11 @@ class CSSIncluder(Includer):
         Includer.__init__(self, *args, **kwargs)
 
         self.tag_string = '<link rel="stylesheet" type="text/css" href="%s" />'
+        self.map_comment = '/*# sourceMappingURL=%s */'
 
-    def _compress(self):
-        output = []
-
+    def _compress(self, out_path):
         src_paths = []
+        compiled_paths = []
 
         for src in self.includes:
 
@@ -139,32 +194,252 @@ class CSSIncluder(Includer):
             else:
                 src_paths.append('www/%s' % src)
 
-            with codecs.open('www/%s' % src, encoding='utf-8') as f:
-                print '- compressing %s' % src
-                output.append(cssmin(f.read()))
+            compiled_paths.append('www/%s' % src)
+
+        output = _parallel_map(_minify_css, compiled_paths)
 
         context = make_context()
         context['paths'] = src_paths
 
         header = render_template('_css_header.css', **context)
-        output.insert(0, header)
 
+        return self._bundle(out_path, header, output)
+
+BASE64_DIGITS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+def _vlq(value):
+    """
+    Encode an integer as a source map base64 VLQ.
+    """
+    value = ((-value) << 1) | 1 if value < 0 else value << 1
+    encoded = ''
+
+    while True:
+        digit = value & 31
+        value >>= 5
+
+        if value:
+            digit |= 32
+
+        encoded += BASE64_DIGITS[digit]
+
+        if not value:
+            return encoded
+
+def _gzip_size(data):
+    """
+    Size in bytes of a string once gzipped.
+    """
+    buf = StringIO()
+
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+
+    return len(buf.getvalue())
+
+def _minify(path, minifier):
+    """
+    Minify a single file, timing it and measuring the result.
+    """
+    with codecs.open(path, encoding='utf-8') as f:
+        print '- compressing %s' % path
+        source = f.read()
+
+    start = time.time()
+    output = minifier(source)
+    elapsed = time.time() - start
+
+    encoded = output.encode('utf-8')
+
+    return {
+        'path': path,
+        'output': output,
+        'raw_size': len(source.encode('utf-8')),
+        'minified_size': len(encoded),
+        'gzip_size': _gzip_size(encoded),
+        'minify_time': round(elapsed, 4)
+    }
+
+def _minify_js(path):
+    """
+    Minify a single Javascript file. Runs in a worker process.
+    """
+    from slimit import minify
+
+    return _minify(path, minify)
+
+def _minify_css(path):
+    """
+    Minify a single CSS file. Runs in a worker process.
+    """
+    from cssmin import cssmin
+
+    return _minify(path, cssmin)
+
+@contextmanager
+def compress_pool():
+    """
+    Worker pool shared by every bundle in a build, or None if
+    minification should run in-process. Always closed and joined.
+    """
+    processes = app_config.COMPRESS_PROCESSES or cpu_count()
+
+    if processes <= 1:
+        yield None
+        return
+
+    pool = Pool(processes)
+
+    try:
+        yield pool
+    finally:
+        pool.close()
+        pool.join()
+
+def _parallel_map(fn, items):
+    """
+    Map `fn` over `items` with the build's worker pool (see
+    `compress_pool`), returning results in the original order.
+    Small bundles, or builds without a pool, are mapped serially.
+    """
+    pool = getattr(g, 'compress_pool', None)
+
+    if pool is None or len(items) < app_config.COMPRESS_PARALLEL_MIN_FILES:
+        return map(fn, items)
+
+    # One file per task so a big file doesn't hold up a batch of small ones
+    return pool.map(fn, items, chunksize=1)
+
+# Flattened app_config, rebuilt whenever app_config.configure_targets() runs
+_app_config_cache = {}
+
+def _cached_app_config():
+    """
+    Returns the memoized app_config cache entry for the current
+    deployment target, rebuilding it if the target has changed.
+    """
+    version = app_config._targets_version
+
+    if _app_config_cache.get('version') != version:
+        config = {}
+
+        # Only all-caps [constant] vars get included
+        for k, v in app_config.__dict__.items():
+            if k.upper() == k:
+                config[k] = v
+
+        js = 'window.APP_CONFIG = ' + json.dumps(config, cls=BetterJSONEncoder)
+
+        _app_config_cache.clear()
+        _app_config_cache.update({
+            'version': version,
+            'config': config,
+            'js': js,
+            'etag': hashlib.md5(js).hexdigest()
+        })
 
-        return '\n'.join(output)
+    return _app_config_cache
 
 def flatten_app_config():
     """
     Returns a copy of app_config containing only
     configuration variables.
     """
-    config = {}
+    return dict(_cached_app_config()['config'])
+
+def app_config_js():
+    """
+    Returns the app_config.js source and its ETag.
+    """
+    cache = _cached_app_config()
+
+    return cache['js'], cache['etag']
+
+def preload_templates(jinja_env):
+    """
+    Compile every template up front so the first request after a
+    worker starts doesn't pay for it.
+    """
+    for name in jinja_env.list_templates():
+        try:
+            jinja_env.get_template(name)
+        except TemplateSyntaxError:
+            # Leave it to fail loudly when it's actually rendered
+            pass
+
+def _file_fingerprint(path):
+    """
+    Returns the (mtime, size) of a file or None if it doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return (stat.st_mtime, stat.st_size)
+
+def _copy_sheets(copy):
+    """
+    The sheets of a copytext.Copy as plain data: {name: (columns, rows)}.
+
+    Copy keeps its sheets in a class attribute, so pickling a Copy saves
+    nothing but its filename.
+    """
+    return dict(
+        (name, (sheet._columns, [list(row) for row in sheet]))
+        for name, sheet in copy._copy.items()
+    )
+
+def _copy_from_sheets(filename, sheets):
+    """
+    Rebuild a copytext.Copy from `_copy_sheets` without reading the spreadsheet.
+    """
+    copy = copytext.Copy.__new__(copytext.Copy)
+    copy._filename = filename
+    copy._copy = dict(
+        (name, copytext.Sheet(name, [dict(zip(columns, row)) for row in rows], columns))
+        for name, (columns, rows) in sheets.items()
+    )
+
+    return copy
+
+def write_copy_snapshot():
+    """
+    Parse the copy spreadsheet once and pickle its sheets, along with
+    the fingerprint of the spreadsheet they were read from.
+    """
+    copy = copytext.Copy(app_config.COPY_PATH)
+
+    snapshot = {
+        'source': _file_fingerprint(app_config.COPY_PATH),
+        'sheets': _copy_sheets(copy)
+    }
+
+    with open(app_config.COPY_SNAPSHOT_PATH, 'wb') as f:
+        pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+
+    return copy
+
+def load_copy():
+    """
+    Load the copy spreadsheet, preferring the snapshot written by
+    `write_copy_snapshot`. Falls back to parsing the spreadsheet if
+    the snapshot is missing, unreadable or older than the spreadsheet.
+    """
+    try:
+        with open(app_config.COPY_SNAPSHOT_PATH, 'rb') as f:
+            snapshot = pickle.load(f)
+    except (IOError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        snapshot = None
 
-    # Only all-caps [constant] vars get included
-    for k, v in app_config.__dict__.items():
-        if k.upper() == k:
-            config[k] = v
+    if snapshot and snapshot.get('sheets') is not None:
+        source = _file_fingerprint(app_config.COPY_PATH)
 
-    return config
+        # No spreadsheet to compare against means the snapshot is all we have
+        if source is None or tuple(snapshot['source'] or ()) == source:
+            return _copy_from_sheets(app_config.COPY_PATH, snapshot['sheets'])
+
+    return copytext.Copy(app_config.COPY_PATH)
 
 def make_context(asset_depth=0):
     """
@@ -175,43 +450,327 @@ def make_context(asset_depth=0):
     the assets are hosted. If 0, then they are at the root.
     If 1 then at /foo/, etc.
     """
-    context = flatten_app_config()
+    with profile_section('make_context'):
+        context = flatten_app_config()
 
-    context['COPY'] = copytext.Copy(app_config.COPY_PATH)
-    context['JS'] = JavascriptIncluder(asset_depth=asset_depth)
-    context['CSS'] = CSSIncluder(asset_depth=asset_depth)
+        context['COPY'] = load_copy()
+        context['JS'] = JavascriptIncluder(asset_depth=asset_depth)
+        context['CSS'] = CSSIncluder(asset_depth=asset_depth)
 
     return context
 
+class RenderProfiler(object):
+    """
+    Collects render timings for a single request.
+
+    Times are inclusive: an include's time counts towards the
+    template that included it, too.
+    """
+    def __init__(self):
+        self.timings = OrderedDict()
+
+    def add(self, label, elapsed):
+        count, total = self.timings.get(label, (0, 0.0))
+        self.timings[label] = (count + 1, total + elapsed)
+
+    @contextmanager
+    def timed(self, label):
+        start = time.time()
+
+        try:
+            yield
+        finally:
+            self.add(label, time.time() - start)
+
+    def timed_generator(self, label, generator):
+        """
+        Time a lazily-rendered template, one event at a time.
+        """
+        elapsed = 0.0
+
+        try:
+            while True:
+                start = time.time()
+
+                try:
+                    event = next(generator)
+                finally:
+                    elapsed += time.time() - start
+
+                yield event
+        except StopIteration:
+            pass
+        finally:
+            self.add(label, elapsed)
+
+    def header(self):
+        """
+        Summarize timings as a Server-Timing header.
+        """
+        metrics = []
+
+        for i, (label, (count, total)) in enumerate(self.timings.items()):
+            metrics.append('t%i;desc="%s x%i";dur=%.2f' % (i, label.replace('"', "'"), count, total * 1000))
+
+        return ', '.join(metrics)
+
+class _ProfiledTemplate(object):
+    """
+    Wraps a template so rendering it, including it or extending it is timed.
+    """
+    def __init__(self, template, profiler):
+        self._template = template
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, *args, **kwargs):
+        with self._profiler.timed('template %s' % self._template.name):
+            return self._template.render(*args, **kwargs)
+
+    def root_render_func(self, context):
+        # Used by {% include %} and {% extends %}
+        return self._profiler.timed_generator('include %s' % self._template.name, self._template.root_render_func(context))
+
+def _current_profiler():
+    """
+    The current request's RenderProfiler, or None if it isn't being profiled.
+    """
+    return getattr(g, 'render_profiler', None) if request else None
+
+def _profiled_filter(name, fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        profiler = _current_profiler()
+
+        if profiler is None:
+            return fn(*args, **kwargs)
+
+        with profiler.timed('filter %s' % name):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+@contextmanager
+def profile_section(label):
+    """
+    Time a block of code if the current request is being profiled.
+    """
+    profiler = _current_profiler()
+
+    if profiler is None:
+        yield
+    else:
+        with profiler.timed(label):
+            yield
+
+def install_render_profiler(app):
+    """
+    Let requests opt in to render profiling with ?profile=1 (or every
+    request with the PROFILE_RENDERS environment variable). Timings for
+    templates, includes, filters and `profile_section` blocks are
+    returned in a Server-Timing header.
+
+    The Jinja environment's get_template and filters are wrapped once,
+    here, and only time anything while the current request is being
+    profiled. Filters added after this is called aren't timed.
+    """
+    jinja_env = app.jinja_env
+    get_template = jinja_env.get_template
+
+    def profiled_get_template(*args, **kwargs):
+        template = get_template(*args, **kwargs)
+        profiler = _current_profiler()
+
+        if profiler is None:
+            return template
+
+        return _ProfiledTemplate(template, profiler)
+
+    jinja_env.get_template = profiled_get_template
+
+    for name, fn in jinja_env.filters.items():
+        jinja_env.filters[name] = _profiled_filter(name, fn)
+
+    @app.before_request
+    def _start_render_profiler():
+        if request.args.get('profile') or os.environ.get('PROFILE_RENDERS'):
+            g.render_profiler = RenderProfiler()
+
+    @app.after_request
+    def _report_render_profile(response):
+        profiler = _current_profiler()
+
+        if profiler is not None:
+            response.headers['Server-Timing'] = profiler.header()
+
+        return response
+
+class PageCache(object):
+    """
+    In-process cache of rendered pages, keyed by request path.
+
+    Each entry remembers the fingerprints of the data files the page was
+    rendered from and is discarded when they change or its TTL expires.
+    The fingerprints are what invalidate pages after `fab text` or
+    `fab data.update_featured_social` rewrite those files: the fab
+    commands run in their own process and can't reach this cache.
+    """
+    def __init__(self):
+        self.pages = {}
+
+    def get(self, path, fingerprint):
+        entry = self.pages.get(path)
+
+        if not entry:
+            return None
+
+        if entry['fingerprint'] != fingerprint or entry['expires'] < time.time():
+            del self.pages[path]
+
+            return None
+
+        return entry
+
+    def set(self, path, fingerprint, response):
+        self.pages[path] = {
+            'fingerprint': fingerprint,
+            'expires': time.time() + app_config.PAGE_CACHE_TTL,
+            'data': response.data,
+            'status': response.status_code,
+            'headers': list(response.headers)
+        }
+
+    def clear(self):
+        self.pages.clear()
+
+page_cache = PageCache()
+
+def cache_page(*data_paths):
+    """
+    Decorator that serves a view from `page_cache` while the copy and
+    the given data files are unchanged. Cached hits skip rendering.
+
+    Disabled when app_config.PAGE_CACHE_TTL is 0.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not app_config.PAGE_CACHE_TTL or request.method != 'GET':
+                return view(*args, **kwargs)
+
+            paths = (app_config.COPY_PATH, app_config.COPY_SNAPSHOT_PATH) + data_paths
+            fingerprint = tuple(_file_fingerprint(path) for path in paths)
+
+            entry = page_cache.get(request.path, fingerprint)
+
+            if entry:
+                return current_app.response_class(entry['data'], entry['status'], entry['headers'])
+
+            response = view(*args, **kwargs)
+
+            if response.status_code == 200 and not response.direct_passthrough:
+                page_cache.set(request.path, fingerprint, response)
+
+            return response
+
+        return wrapper
+
+    return decorator
+
+class LRUCache(object):
+    """
+    A least-recently-used cache that counts its hits and misses. Safe to
+    share between threads; values are computed outside the lock.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key, compute):
+        """
+        Return the cached value for `key`, calling `compute(key)` on a miss.
+        """
+        if not self.size:
+            return compute(key)
+
+        with self.lock:
+            try:
+                value = self._items.pop(key)
+                self.hits += 1
+                self._items[key] = value
+
+                return value
+            except KeyError:
+                self.misses += 1
+
+        value = compute(key)
+
+        with self.lock:
+            self._items.pop(key, None)
+
+            if len(self._items) >= self.size:
+                self._items.popitem(last=False)
+
+            self._items[key] = value
+
+        return value
+
+    def clear(self):
+        with self.lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._items)
+            }
+
+filter_caches = {
+    'smarty': LRUCache(app_config.FILTER_CACHE_SIZE),
+    'urlencode': LRUCache(app_config.FILTER_CACHE_SIZE)
+}
+
+def filter_cache_stats():
+    """
+    Hit/miss counters for the memoized template filters.
+    """
+    return dict((name, cache.stats()) for name, cache in filter_caches.items())
+
+def _urlencode(s):
+    return Markup(urllib.quote_plus(s.encode('utf-8')))
+
+def _smartypants(s):
+    # On Markup, smartypants' own replacements would be escaped
+    return Markup(smartypants(unicode(s)))
+
 def urlencode_filter(s):
     """
     Filter to urlencode strings.
     """
-    if type(s) == 'Markup':
+    if isinstance(s, Markup):
         s = s.unescape()
-
-    # Evaulate COPY elements
-    if type(s) is not unicode:
+    elif not isinstance(s, unicode):
+        # Evaulate COPY elements
         s = unicode(s)
 
-    s = s.encode('utf8')
-    s = urllib.quote_plus(s)
-
-    return Markup(s)
+    return filter_caches['urlencode'].get(s, _urlencode)
 
 def smarty_filter(s):
     """
     Filter to smartypants strings.
     """
-    if type(s) == 'Markup':
-        s = s.unescape()
-
-    # Evaulate COPY elements
-    if type(s) is not unicode:
+    # Markup is already HTML, which smartypants handles as-is
+    if not isinstance(s, unicode):
+        # Evaulate COPY elements
         s = unicode(s)
 
-    s = s.encode('utf-8')
-    s = smartypants(s)
-
-    return Markup(s)
-
+    return filter_caches['smarty'].get(s, _smartypants)
@@ -1,25 +1,240 @@
 #!/usr/bin/env python
 
-import json
+from datetime import datetime
+import hashlib
 from mimetypes import guess_type
 import os
+import re
 import subprocess
+import urllib
 
-from flask import abort, make_response
+from flask import abort, current_app, make_response, request
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
 
 import app_config
-import copytext
 from flask import Blueprint
-from render_utils import BetterJSONEncoder, flatten_app_config
+from render_utils import app_config_js, load_copy
+import watcher
 
 static = Blueprint('static', __name__)
 
+# Size of the chunks read when streaming part of a file
+CHUNK_SIZE = 64 * 1024
+
+RANGE_REGEX = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def _tree(root):
+    """
+    List every file beneath a directory.
+    """
+    paths = []
+
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            paths.append(os.path.join(dirpath, filename))
+
+    return paths
+
+def _fingerprint(paths):
+    """
+    Build a strong ETag and Last-Modified time from the source files
+    an asset is generated from. Missing files are ignored.
+    """
+    digest = hashlib.md5()
+    last_modified = None
+
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        digest.update('%s:%r:%i;' % (path, stat.st_mtime, stat.st_size))
+        last_modified = max(last_modified, int(stat.st_mtime))
+
+    if last_modified is not None:
+        last_modified = datetime.utcfromtimestamp(last_modified)
+
+    return digest.hexdigest(), last_modified
+
+def _not_modified(etag, last_modified):
+    """
+    Check the request's If-None-Match and If-Modified-Since headers.
+    """
+    return not is_resource_modified(request.environ, etag, last_modified=last_modified)
+
+def _set_cache_headers(response, etag, last_modified):
+    """
+    Attach validators to a response.
+    """
+    response.set_etag(etag)
+
+    if last_modified:
+        response.last_modified = last_modified
+
+    return response
+
+def _conditional_response(etag, last_modified, content_type, render):
+    """
+    Answer conditional GETs with a 304, only calling `render` to build
+    the response body when the client's copy is out of date.
+    """
+    if _not_modified(etag, last_modified):
+        response = make_response('', 304)
+    else:
+        response = make_response(render(), 200, { 'Content-Type': content_type })
+
+    return _set_cache_headers(response, etag, last_modified)
+
+def _built_response(key, directory, sources, content_type, build):
+    """
+    Serve an asset compiled from the files `sources()` lists, through
+    the watcher's cache when it's running.
+
+    The validators are fingerprinted when the asset is built and cached
+    with it, so they describe the body that's served even if the sources
+    have changed and the watcher hasn't rebuilt it yet.
+    """
+    def fingerprint():
+        etag, last_modified = _fingerprint(sources())
+
+        # Assets built from the same files still need their own ETags
+        return hashlib.md5('%s:%s' % (key, etag)).hexdigest(), last_modified
+
+    if watcher.get() is None:
+        etag, last_modified = fingerprint()
+
+        return _conditional_response(etag, last_modified, content_type, build)
+
+    def build_with_fingerprint():
+        etag, last_modified = fingerprint()
+
+        return etag, last_modified, build()
+
+    etag, last_modified, body = watcher.cached(key, directory, build_with_fingerprint)
+
+    return _conditional_response(etag, last_modified, content_type, lambda: body)
+
+def _byte_range(etag, length):
+    """
+    Parse a single-range Range header into (start, end) inclusive offsets.
+
+    Returns None to serve the whole file (no range, a stale If-Range or a
+    multi-range request) and False if the range can't be satisfied.
+    """
+    header = request.headers.get('Range')
+
+    if not header:
+        return None
+
+    if_range = request.headers.get('If-Range')
+
+    if if_range and if_range.strip('"') != etag:
+        return None
+
+    match = RANGE_REGEX.match(header.strip())
+
+    if not match:
+        return None
+
+    start, end = match.groups()
+
+    if start:
+        start = int(start)
+        end = min(int(end), length - 1) if end else length - 1
+    elif end:
+        # Suffix range: the last N bytes
+        start = max(length - int(end), 0)
+        end = length - 1
+    else:
+        return None
+
+    if start > end or start >= length:
+        return False
+
+    return start, end
+
+def _read_range(path, start, length):
+    """
+    Stream `length` bytes of a file starting at `start`.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+
+            if not chunk:
+                break
+
+            length -= len(chunk)
+
+            yield chunk
+
+def _x_accel_redirect(path):
+    """
+    When nginx tells us it can serve files itself (see confs/nginx.conf),
+    map a local path to the internal location it serves them from.
+    """
+    if request.environ.get('HTTP_X_SENDFILE_TYPE') != 'X-Accel-Redirect':
+        return None
+
+    path = os.path.abspath(path)
+
+    for mapping in request.environ.get('HTTP_X_ACCEL_MAPPING', '').split(','):
+        if '=' not in mapping:
+            continue
+
+        root, location = [bit.strip() for bit in mapping.split('=', 1)]
+
+        if path.startswith(root):
+            return location + urllib.quote(path[len(root):])
+
+    return None
+
+def _file_response(path, etag):
+    """
+    Stream a file without reading it into memory, honoring Range requests.
+    """
+    length = os.path.getsize(path)
+    content_type = guess_type(path)[0]
+    byte_range = _byte_range(etag, length)
+
+    if byte_range is False:
+        response = make_response('', 416)
+        response.headers['Content-Range'] = 'bytes */%i' % length
+    elif byte_range:
+        start, end = byte_range
+
+        response = current_app.response_class(
+            _read_range(path, start, end - start + 1),
+            206,
+            { 'Content-Type': content_type },
+            direct_passthrough=True
+        )
+        response.headers['Content-Range'] = 'bytes %i-%i/%i' % (start, end, length)
+        response.headers['Content-Length'] = str(end - start + 1)
+    else:
+        response = current_app.response_class(
+            wrap_file(request.environ, open(path, 'rb'), CHUNK_SIZE),
+            200,
+            { 'Content-Type': content_type },
+            direct_passthrough=True
+        )
+        response.headers['Content-Length'] = str(length)
+
+    response.headers['Accept-Ranges'] = 'bytes'
+
+    return response
+
 # Render JST templates on-demand
 @static.route('/js/templates.js')
 def _templates_js():
-    r = subprocess.check_output(["node_modules/universal-jst/bin/jst.js", "--template", "underscore", "jst"])
+    def build():
+        return subprocess.check_output(["node_modules/universal-jst/bin/jst.js", "--template", "underscore", "jst"])
 
-    return make_response(r, 200, { 'Content-Type': 'application/javascript' })
+    return _built_response('templates.js', 'jst', lambda: _tree('jst'), 'application/javascript', build)
 
 # Render LESS files on-demand
 @static.route('/less/<string:filename>')
@@ -27,30 +242,47 @@ def _less(filename):
     if not os.path.exists('less/%s' % filename):
         abort(404)
 
-    r = subprocess.check_output(["node_modules/less/bin/lessc", "less/%s" % filename])
+    def build():
+        return subprocess.check_output(["node_modules/less/bin/lessc", "less/%s" % filename])
 
-    return make_response(r, 200, { 'Content-Type': 'text/css' })
+    # LESS files can @import each other, so any change invalidates all of them
+    return _built_response('less/%s' % filename, 'less', lambda: _tree('less'), 'text/css', build)
 
 # Render application configuration
 @static.route('/js/app_config.js')
 def _app_config_js():
-    config = flatten_app_config()
-    js = 'window.APP_CONFIG = ' + json.dumps(config, cls=BetterJSONEncoder)
+    js, etag = app_config_js()
 
-    return make_response(js, 200, { 'Content-Type': 'application/javascript' })
+    return _conditional_response(etag, None, 'application/javascript', lambda: js)
 
 # Render copytext
 @static.route('/js/copy.js')
 def _copy_js():
-    copy = 'window.COPY = ' + copytext.Copy(app_config.COPY_PATH).json()
+    def build():
+        return 'window.COPY = ' + load_copy().json()
 
-    return make_response(copy, 200, { 'Content-Type': 'application/javascript' })
+    return _built_response('copy.js', 'data', lambda: [app_config.COPY_PATH, app_config.COPY_SNAPSHOT_PATH], 'application/javascript', build)
 
 # Server arbitrary static files on-demand
 @static.route('/<path:path>')
 def _static(path):
-    try:
-        with open('www/%s' % path) as f:
-            return make_response(f.read(), 200, { 'Content-Type': guess_type(path)[0] })
-    except IOError:
+    path = 'www/%s' % path
+
+    if not os.path.isfile(path):
         abort(404)
+
+    etag, last_modified = _fingerprint([path])
+
+    if _not_modified(etag, last_modified):
+        return _set_cache_headers(make_response('', 304), etag, last_modified)
+
+    accel_path = _x_accel_redirect(path)
+
+    if accel_path:
+        # nginx serves the body (and ranges) itself
+        response = make_response('', 200, { 'Content-Type': guess_type(path)[0] })
+        response.headers['X-Accel-Redirect'] = accel_path
+    else:
+        response = _file_response(path, etag)
+
+    return _set_cache_headers(response, etag, last_modified)
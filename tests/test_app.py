@@ -1,10 +1,16 @@
 #!/usr/bin/env python
 
 import json
+import os
+import shutil
+import tempfile
+import time
 import unittest
 
 import app
 import app_config
+import static
+import watcher
 
 class IndexTestCase(unittest.TestCase):
     """
@@ -51,5 +57,139 @@ class AppConfigTestCase(unittest.TestCase):
         
         app_config.configure_targets('staging')
 
+    def test_app_config_etag(self):
+        response = self.client.get('/js/app_config.js')
+
+        etag = response.headers['ETag']
+
+        response = self.client.get('/js/app_config.js', headers={ 'If-None-Match': etag })
+
+        assert response.status_code == 304
+
+    def test_app_config_etag_changes_with_target(self):
+        etag = self.client.get('/js/app_config.js').headers['ETag']
+
+        app_config.configure_targets('production')
+
+        response = self.client.get('/js/app_config.js', headers={ 'If-None-Match': etag })
+
+        assert response.status_code == 200
+        assert self.parse_data(response)['DEBUG'] == False
+
+        app_config.configure_targets('staging')
+
+class StaticTestCase(unittest.TestCase):
+    """
+    Test conditional GET support in the static blueprint.
+    """
+    def setUp(self):
+        app.app.config['TESTING'] = True
+        self.client = app.app.test_client()
+
+    def test_static_headers(self):
+        response = self.client.get('/js/app.js')
+
+        assert response.status_code == 200
+        assert response.headers['ETag']
+        assert response.headers['Last-Modified']
+
+    def test_static_if_none_match(self):
+        etag = self.client.get('/js/app.js').headers['ETag']
+
+        response = self.client.get('/js/app.js', headers={ 'If-None-Match': etag })
+
+        assert response.status_code == 304
+        assert response.data == ''
+
+    def test_static_if_modified_since(self):
+        last_modified = self.client.get('/js/app.js').headers['Last-Modified']
+
+        response = self.client.get('/js/app.js', headers={ 'If-Modified-Since': last_modified })
+
+        assert response.status_code == 304
+
+    def test_static_range(self):
+        with open('www/js/app.js') as f:
+            content = f.read()
+
+        response = self.client.get('/js/app.js', headers={ 'Range': 'bytes=0-9' })
+
+        assert response.status_code == 206
+        assert response.data == content[:10]
+        assert response.headers['Content-Range'] == 'bytes 0-9/%i' % len(content)
+
+    def test_static_suffix_range(self):
+        with open('www/js/app.js') as f:
+            content = f.read()
+
+        response = self.client.get('/js/app.js', headers={ 'Range': 'bytes=-5' })
+
+        assert response.status_code == 206
+        assert response.data == content[-5:]
+
+    def test_static_unsatisfiable_range(self):
+        response = self.client.get('/js/app.js', headers={ 'Range': 'bytes=100000000-' })
+
+        assert response.status_code == 416
+
+    def test_static_x_accel_redirect(self):
+        root = '%s/www/' % os.path.abspath('.')
+
+        response = self.client.get('/js/app.js', environ_base={
+            'HTTP_X_SENDFILE_TYPE': 'X-Accel-Redirect',
+            'HTTP_X_ACCEL_MAPPING': '%s=/linklater/_www/' % root
+        })
+
+        assert response.headers['X-Accel-Redirect'] == '/linklater/_www/js/app.js'
+        assert response.data == ''
+
+    def test_built_etag_matches_cached_body(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'source.txt')
+        builds = []
+
+        def build():
+            builds.append(1)
+
+            return 'build %i' % len(builds)
+
+        def get():
+            with app.app.test_request_context('/'):
+                response = static._built_response('asset', directory, lambda: [path], 'text/plain', build)
+
+                return response.headers['ETag'], response.data
+
+        with open(path, 'w') as f:
+            f.write('a')
+
+        watcher._watcher = watcher.Watcher([directory])
+
+        try:
+            etag, body = get()
+
+            # The watcher hasn't rebuilt yet, so neither body nor ETag changes
+            with open(path, 'w') as f:
+                f.write('ab')
+
+            os.utime(path, (time.time() + 10, time.time() + 10))
+
+            assert get() == (etag, body)
+
+            watcher._watcher.changed(directory)
+
+            new_etag, new_body = get()
+        finally:
+            watcher._watcher = None
+            shutil.rmtree(directory)
+
+        assert body == 'build 1'
+        assert new_body == 'build 2'
+        assert new_etag != etag
+
+    def test_static_missing(self):
+        response = self.client.get('/js/does-not-exist.js')
+
+        assert response.status_code == 404
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+from datetime import datetime
+import unittest
+
+from etc.archive import LinkArchive, week_of
+
+class LinkArchiveTestCase(unittest.TestCase):
+    """
+    Test the archive of previously unfurled links.
+    """
+    def setUp(self):
+        self.archive = LinkArchive(':memory:')
+
+    def tearDown(self):
+        self.archive.close()
+
+    def test_week_of(self):
+        assert week_of(datetime(2015, 1, 23)) == '2015-W04'
+
+    def test_seen_before(self):
+        link = { 'url': 'http://npr.org/a', 'tweet_url': 'http://twitter.com/nprviz/status/1' }
+
+        self.archive.add(link, '2015-W03')
+
+        assert self.archive.seen_before(link, '2015-W04')
+        assert not self.archive.seen_before(link, '2015-W03')
+        assert not self.archive.seen_before({ 'url': 'http://npr.org/b' }, '2015-W04')
+
+    def test_seen_before_canonical(self):
+        self.archive.add({ 'url': 'http://npr.org/a?utm=twitter', 'canonical_url': 'http://npr.org/a' }, '2015-W03')
+
+        assert self.archive.seen_before({ 'url': 'http://m.npr.org/a', 'canonical_url': 'http://npr.org/a' }, '2015-W04')
+
+    def test_seen_before_without_canonical(self):
+        self.archive.add({ 'url': 'http://npr.org/a?utm_source=twitter' }, '2015-W03')
+
+        assert self.archive.seen_before({ 'url': 'http://m.npr.org/a', 'canonical_url': 'http://npr.org/a' }, '2015-W04')
+
+    def test_merge_tweet_ids(self):
+        link_id = self.archive.add({ 'url': 'http://npr.org/a', 'tweet_url': 'http://twitter.com/nprviz/status/1' }, '2015-W04')
+        self.archive.add({ 'url': 'http://npr.org/a', 'tweet_url': 'http://twitter.com/nprnews/status/2' }, '2015-W04')
+
+        row = self.archive.connection.execute('SELECT * FROM links WHERE id = ?', (link_id,)).fetchone()
+
+        assert row['tweet_ids'] == '1,2'
+
+    def test_search(self):
+        self.archive.add({ 'url': 'http://npr.org/a', 'title': 'Cats in space' }, '2015-W03')
+        self.archive.add({ 'url': 'http://npr.org/b', 'title': 'Dogs', 'description': 'Also in space' }, '2015-W04')
+
+        results = self.archive.search('space')
+
+        assert [row['url'] for row in results] == ['http://npr.org/b', 'http://npr.org/a']
+        assert len(self.archive.search('cats')) == 1
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+
+from datetime import datetime
+import json
+import os
+import re
+import tempfile
+import unittest
+
+import httpretty
+
+import app_config
+from etc.failures import NegativeCache
+from fabfile import data
+
+SECRETS = {
+    'TWITTER_API_OAUTH_TOKEN': 'token',
+    'TWITTER_API_OAUTH_SECRET': 'secret',
+    'TWITTER_API_CONSUMER_KEY': 'key',
+    'TWITTER_API_CONSUMER_SECRET': 'secret',
+    'FACEBOOK_API_APP_TOKEN': 'token'
+}
+
+def make_tweet(tweet_id, text='Look at this', entities=None):
+    return {
+        'id': int(tweet_id),
+        'id_str': tweet_id,
+        'text': text,
+        'created_at': 'Fri Jan 23 14:00:00 +0000 2015',
+        'favorite_count': 1,
+        'retweet_count': 2,
+        'entities': entities or {},
+        'user': {
+            'id': 1,
+            'name': 'NPR Visuals',
+            'screen_name': 'nprviz',
+            'profile_image_url': 'http://example.com/nprviz.png',
+            'url': 'http://apps.npr.org'
+        }
+    }
+
+class FeaturedSocialTestCase(unittest.TestCase):
+    """
+    Test fetching featured tweets and Facebook posts against fake endpoints.
+    """
+    @httpretty.activate
+    def test_tweets_single_lookup(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.twitter.com/1.1/statuses/lookup.json',
+            body=json.dumps([make_tweet('2'), make_tweet('1')])
+        )
+
+        tweets = data._fetch_featured_tweets(SECRETS, ['1', '2', '3'])
+
+        assert [tweet['id'] for tweet in tweets] == [1, 2]
+        assert len(httpretty.HTTPretty.latest_requests) == 1
+        assert httpretty.last_request().querystring['id'] == ['1,2,3']
+
+    @httpretty.activate
+    def test_facebook_single_batch(self):
+        post = {
+            'id': '1_2',
+            'message': 'Look at this',
+            'link': 'http://apps.npr.org',
+            'name': 'NPR Visuals',
+            'description': 'Links',
+            'picture': 'http://example.com/link.png',
+            'created_time': '2015-01-23T14:00:00+0000',
+            'from': { 'id': '1' }
+        }
+
+        bodies = [
+            post,
+            { 'name': 'NPR', 'link': 'http://facebook.com/npr' },
+            { 'data': { 'url': 'http://example.com/npr.png' } },
+            { 'summary': { 'total_count': 10 } },
+            { 'summary': { 'total_count': 3 } }
+        ]
+
+        httpretty.register_uri(
+            httpretty.POST,
+            'https://graph.facebook.com/',
+            body=json.dumps([{ 'code': 200, 'body': json.dumps(body) } for body in bodies])
+        )
+
+        posts = data._fetch_featured_facebook_posts(SECRETS, ['1_2'])
+
+        assert len(httpretty.HTTPretty.latest_requests) == 1
+        assert posts[0]['from']['picture'] == 'http://example.com/npr.png'
+        assert posts[0]['likes'] == 10
+        assert posts[0]['comments'] == 3
+        assert posts[0]['creation_date'] == 'Jan 23'
+
+    def test_no_ids(self):
+        assert data._fetch_featured_tweets(SECRETS, []) == []
+        assert data._fetch_featured_facebook_posts(SECRETS, []) == []
+
+def make_link_tweet(tweet_id, url):
+    tweet = make_tweet(tweet_id, text=u'Look http://t.co/x', entities={
+        'urls': [{ 'url': 'http://t.co/x', 'expanded_url': url, 'display_url': url, 'indices': [5, 18] }]
+    })
+    tweet['created_at'] = datetime.now().strftime('%a %b %d %H:%M:%S +0000 %Y')
+
+    return tweet
+
+class FetchLinksTestCase(unittest.TestCase):
+    """
+    Test fetching and unfurling links for several handles at once.
+    """
+    def setUp(self):
+        self.grabbed = []
+        self.head_only = []
+        self.grab_url = data._grab_url
+        self.get_secrets = app_config.get_secrets
+        self.archive_path = app_config.LINK_ARCHIVE_PATH
+
+        def fake_grab_url(url, *args, **kwargs):
+            self.grabbed.append(url)
+            self.head_only.append(kwargs.get('head_only', False))
+
+            return { 'url': url, 'title': 'A story', 'image': '%s.jpg' % url }
+
+        data._grab_url = fake_grab_url
+        app_config.get_secrets = lambda: SECRETS
+        app_config.LINK_ARCHIVE_PATH = ':memory:'
+
+    def tearDown(self):
+        data._grab_url = self.grab_url
+        app_config.get_secrets = self.get_secrets
+        app_config.LINK_ARCHIVE_PATH = self.archive_path
+
+    @httpretty.activate
+    def test_shared_links_unfurled_once(self):
+        timelines = {
+            'nprviz': [make_link_tweet('2', 'http://npr.org/b'), make_link_tweet('1', 'http://npr.org/a')],
+            'nprnews': [make_link_tweet('3', 'http://npr.org/a')]
+        }
+
+        # One entry per user: httpretty keeps the current request on the
+        # entry, so a shared callback can see the other thread's request
+        for username, tweets in timelines.items():
+            httpretty.register_uri(
+                httpretty.GET,
+                re.compile(r'^https://api\.twitter\.com/1\.1/statuses/user_timeline\.json\?.*screen_name=%s(&|$)' % username),
+                body=json.dumps(tweets),
+                match_querystring=True
+            )
+
+        links = data.fetch_links(['nprviz', 'nprnews'], 7)
+
+        assert sorted(self.grabbed) == ['http://npr.org/a', 'http://npr.org/b']
+        assert [link['url'] for link in links['nprviz']] == ['http://npr.org/b', 'http://npr.org/a']
+        assert links['nprnews'][0]['tweet_url'] == 'http://twitter.com/nprnews/status/3'
+
+    def test_no_users(self):
+        assert data.fetch_links([], 7) == {}
+
+    @httpretty.activate
+    def test_short_links_resolved_before_unfurling(self):
+        tweets = [make_link_tweet('2', 'http://n.pr/a'), make_link_tweet('1', 'http://npr.org/a')]
+
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.twitter.com/1.1/statuses/user_timeline.json',
+            body=json.dumps(tweets)
+        )
+        httpretty.register_uri(httpretty.HEAD, 'http://n.pr/a', status=301, location='http://npr.org/a?utm_source=twitter')
+
+        links = data.fetch_links(['nprviz'], 7)
+
+        assert self.grabbed == ['http://npr.org/a?utm_source=twitter']
+        assert len(links['nprviz']) == 1
+
+    @httpretty.activate
+    def test_prefetched_links_reused(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+        app_config.LINK_ARCHIVE_PATH = path
+
+        timeline = [make_link_tweet('1', 'http://npr.org/a')]
+
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.twitter.com/1.1/statuses/user_timeline.json',
+            body=lambda request, uri, headers: (200, headers, json.dumps(timeline))
+        )
+
+        try:
+            data.prefetch_links(['nprviz'], 7)
+
+            assert self.grabbed == ['http://npr.org/a']
+
+            timeline = [make_link_tweet('2', 'http://npr.org/b')]
+
+            links = data.fetch_links(['nprviz'], 7)
+        finally:
+            os.remove(path)
+
+        assert httpretty.last_request().querystring['since_id'] == ['1']
+        assert self.grabbed == ['http://npr.org/a', 'http://npr.org/b']
+        assert [link['url'] for link in links['nprviz']] == ['http://npr.org/b', 'http://npr.org/a']
+
+    @httpretty.activate
+    def test_twitter_metadata(self):
+        complete = make_link_tweet('2', 'http://npr.org/a')
+        complete['entities']['urls'][0].update({
+            'unwound_url': 'http://www.npr.org/a',
+            'title': 'Cats in space',
+            'description': 'They float',
+            'images': [{ 'url': 'http://npr.org/a-large.jpg' }, { 'url': 'http://npr.org/a-small.jpg' }]
+        })
+
+        no_image = make_link_tweet('1', 'http://n.pr/b')
+        no_image['entities']['urls'][0]['unwound'] = {
+            'url': 'http://www.npr.org/b',
+            'status': 200,
+            'title': 'Dogs on the moon'
+        }
+
+        httpretty.register_uri(
+            httpretty.GET,
+            'https://api.twitter.com/1.1/statuses/user_timeline.json',
+            body=json.dumps([complete, no_image])
+        )
+
+        links = data.fetch_links(['nprviz'], 7)
+
+        assert httpretty.last_request().querystring['tweet_mode'] == ['extended']
+        assert self.grabbed == ['http://www.npr.org/b']
+        assert self.head_only == [True]
+
+        assert links['nprviz'][0]['title'] == 'Cats in space'
+        assert links['nprviz'][0]['image'] == 'http://npr.org/a-large.jpg'
+        assert links['nprviz'][1]['title'] == 'Dogs on the moon'
+        assert links['nprviz'][1]['image'] == 'http://www.npr.org/b.jpg'
+
+    def test_twitter_page_unavailable(self):
+        entity = { 'expanded_url': 'http://npr.org/a', 'unwound': { 'url': 'http://npr.org/a', 'status': 404, 'title': 'Not found' } }
+
+        assert data._twitter_page(entity) is None
+        assert data._twitter_page({ 'expanded_url': 'http://npr.org/a' }) is None
+
+class DedupeLinksTestCase(unittest.TestCase):
+    """
+    Test removing duplicate links.
+    """
+    def test_same_short_title_kept(self):
+        links = [{ 'url': 'http://a.com/1', 'title': 'Video' }, { 'url': 'http://b.com/2', 'title': 'Video' }]
+
+        assert data._dedupe_links(links) == links
+
+    def test_near_duplicate(self):
+        description = 'Scientists discover a new species of frog in the Andes mountains of Peru'
+        links = [
+            { 'url': 'http://a.com/1', 'title': 'New frog', 'description': description },
+            { 'url': 'http://b.com/2', 'title': 'New frog', 'description': description + '.' }
+        ]
+
+        assert data._dedupe_links(links) == links[:1]
+
+class GrabUrlTestCase(unittest.TestCase):
+    """
+    Test unfurling a page against a fake endpoint.
+    """
+    @httpretty.activate
+    def test_head_only(self):
+        html = '<html><head><meta property="og:title" content="Cats"><meta property="og:image" content="http://npr.org/cats.jpg"></head><body>%s</body></html>' % ('x' * 100000)
+
+        httpretty.register_uri(httpretty.GET, 'http://npr.org/cats', body=html, content_type='text/html; charset=utf-8')
+
+        page = data._grab_url('http://npr.org/cats', head_only=True)
+
+        assert page['title'] == 'Cats'
+        assert page['image'] == 'http://npr.org/cats.jpg'
+        assert page['canonical_url'] == 'http://npr.org/cats'
+
+    @httpretty.activate
+    def test_failing_oembed_endpoint_skipped(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+        html = '<html><head><meta property="og:title" content="A video"></head></html>'
+
+        httpretty.register_uri(httpretty.GET, 'https://vimeo.com/api/oembed.json', status=503, body='Unavailable')
+        httpretty.register_uri(httpretty.GET, 'https://vimeo.com/1', body=html, content_type='text/html')
+
+        try:
+            negative_cache = NegativeCache(path)
+            negative_cache.host_failed('https://vimeo.com/api/oembed.json', 'oEmbed HTTP 503')
+
+            page = data._grab_url('https://vimeo.com/1', negative_cache)
+        finally:
+            os.remove(path)
+
+        assert page['title'] == 'A video'
+        assert [request.path for request in httpretty.HTTPretty.latest_requests] == ['/1']
+
+    @httpretty.activate
+    def test_head_only_not_html(self):
+        import requests
+
+        closed = []
+        close = requests.Response.close
+
+        def recording_close(resp):
+            closed.append(resp.url)
+            close(resp)
+
+        # No Content-Type at all
+        httpretty.register_uri(httpretty.GET, 'http://npr.org/cats.bin', body='x' * 1000, forcing_headers={ 'server': 'fake' })
+
+        requests.Response.close = recording_close
+
+        try:
+            page = data._grab_url('http://npr.org/cats.bin', head_only=True)
+        finally:
+            requests.Response.close = close
+
+        assert page is None
+        assert closed == ['http://npr.org/cats.bin']
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+import unittest
+
+from etc.dedupe import MinHasher, normalize_url, shingles
+
+class NormalizeUrlTestCase(unittest.TestCase):
+    """
+    Test URL normalization.
+    """
+    def test_tracking_params(self):
+        assert normalize_url('http://NPR.org/a?utm_source=twitter&id=1#comments') == 'http://npr.org/a?id=1'
+
+    def test_unicode_query(self):
+        assert normalize_url(u'http://example.com/search?q=caf%C3%A9&utm_source=twitter') == u'http://example.com/search?q=caf%C3%A9'
+        assert normalize_url(u'http://example.com/search?q=caf\xe9&ref=tw') == u'http://example.com/search?q=caf\xe9'
+
+    def test_empty_path(self):
+        assert normalize_url('http://npr.org') == 'http://npr.org/'
+
+class MinHasherTestCase(unittest.TestCase):
+    """
+    Test MinHash near-duplicate detection.
+    """
+    def test_shingles(self):
+        assert shingles(u'One two three four') == set([u'one two three', u'two three four'])
+        assert shingles(u'Short') == set([u'short'])
+        assert shingles(u'') == set()
+
+    def test_duplicates(self):
+        texts = [
+            u'Scientists discover a new species of frog in the Andes mountains of Peru after a decade of searching',
+            u'A recipe for pie',
+            u'Scientists discover a new species of frog in the Andes mountains of Peru after a decade of searching.',
+            u'',
+            u'Scientists discover a new species of toad in the Alps'
+        ]
+
+        assert MinHasher().duplicates(texts) == [2]
+
+    def test_short_texts_not_duplicates(self):
+        assert MinHasher().duplicates([u'Video', u'Video', u'Watch this video', u'Watch this video']) == []
+
+    def test_similarity(self):
+        hasher = MinHasher()
+        signature = hasher.signature(shingles(u'the quick brown fox jumps over the lazy dog'))
+
+        assert hasher.similarity(signature, signature) == 1.0
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import time
+import unittest
+
+from etc.failures import NegativeCache
+
+class NegativeCacheTestCase(unittest.TestCase):
+    """
+    Test the cache of URLs and hosts that failed to unfurl.
+    """
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+        self.cache = NegativeCache(self.path, base=60)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_blocked_after_failure(self):
+        assert self.cache.blocked('http://npr.org/a') is None
+
+        self.cache.failed('http://npr.org/a', 'HTTP 404', host_failure=False)
+
+        assert self.cache.blocked('http://npr.org/a') == 'HTTP 404'
+        assert not self.cache.host_penalized('http://npr.org/b')
+        assert self.cache.stats['skipped'] == 1
+
+    def test_host_penalized(self):
+        self.cache.failed('http://slow.example.com/a', 'timeout')
+
+        assert self.cache.host_penalized('http://SLOW.example.com/b')
+        assert self.cache.blocked('http://slow.example.com/b') is None
+
+    def test_host_escalates_once_per_window(self):
+        for i in range(10):
+            self.cache.failed('http://slow.example.com/%i' % i, 'timeout')
+
+        host = self.cache.entries['host:slow.example.com']
+
+        assert host['failures'] == 1
+        assert host['retry_after'] - time.time() <= 60
+
+        host['retry_after'] = time.time() - 1
+        self.cache.failed('http://slow.example.com/a', 'timeout')
+
+        assert self.cache.entries['host:slow.example.com']['failures'] == 2
+
+    def test_backoff_doubles(self):
+        self.cache.failed('http://npr.org/a', 'timeout')
+        first = self.cache.entries['url:http://npr.org/a']['retry_after'] - time.time()
+
+        self.cache.failed('http://npr.org/a', 'timeout')
+        second = self.cache.entries['url:http://npr.org/a']['retry_after'] - time.time()
+
+        assert 55 < first <= 60
+        assert 115 < second <= 120
+
+    def test_backoff_limit(self):
+        cache = NegativeCache(self.path, base=60, limit=100)
+
+        for i in range(5):
+            cache.failed('http://npr.org/a', 'timeout')
+
+        assert cache.entries['url:http://npr.org/a']['retry_after'] - time.time() <= 100
+
+    def test_expired(self):
+        self.cache.failed('http://npr.org/a', 'timeout')
+        self.cache.entries['url:http://npr.org/a']['retry_after'] = time.time() - 1
+
+        assert self.cache.blocked('http://npr.org/a') is None
+
+    def test_succeeded_clears(self):
+        self.cache.failed('http://npr.org/a', 'HTTP 503')
+        self.cache.succeeded('http://npr.org/b')
+
+        assert self.cache.blocked('http://npr.org/a') == 'HTTP 503'
+        assert not self.cache.host_penalized('http://npr.org/a')
+
+    def test_persisted(self):
+        self.cache.failed('http://npr.org/a', 'timeout')
+        self.cache.failed('http://npr.org/b', 'timeout')
+        self.cache.save()
+
+        self.cache.succeeded('http://npr.org/b')
+        self.cache.save()
+
+        cache = NegativeCache(self.path)
+
+        assert cache.blocked('http://npr.org/a') == 'timeout'
+        assert cache.blocked('http://npr.org/b') is None
+
+    def test_report(self):
+        self.cache.failed('http://npr.org/a', 'timeout')
+        self.cache.blocked('http://npr.org/a')
+
+        lines = self.cache.report()
+
+        assert '1 URLs skipped' in lines[0]
+        assert 'url:http://npr.org/a (timeout' in lines[2]
+
+if __name__ == '__main__':
+    unittest.main()
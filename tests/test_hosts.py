@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+
+from etc.hosts import HostLatencies, RateLimiter, interleave_by_host, percentile
+
+class HostLatenciesTestCase(unittest.TestCase):
+    """
+    Test per-host timeouts derived from observed latencies.
+    """
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+        self.latencies = HostLatencies(self.path, default=5, minimum=1, maximum=10)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_percentile(self):
+        assert percentile(range(1, 101), 0.95) == 95
+        assert percentile([3], 0.95) == 3
+
+    def test_default_until_enough_samples(self):
+        self.latencies.record('http://npr.org/a', 0.1)
+        self.latencies.record('http://npr.org/b', 0.1)
+
+        assert self.latencies.timeout('http://npr.org/c') == 5
+
+    def test_fast_host(self):
+        for i in range(10):
+            self.latencies.record('http://npr.org/%i' % i, 0.2)
+
+        assert self.latencies.timeout('http://npr.org/') == 1
+
+    def test_slow_host(self):
+        for i in range(10):
+            self.latencies.record('http://slow.example.com/%i' % i, 3)
+
+        assert self.latencies.timeout('http://slow.example.com/') == 6
+
+        for i in range(10):
+            self.latencies.record('http://slow.example.com/%i' % i, 20)
+
+        assert self.latencies.timeout('http://slow.example.com/') == 10
+
+    def test_timeouts_raise_timeout(self):
+        for i in range(10):
+            self.latencies.record('http://npr.org/%i' % i, 0.2)
+
+        for i in range(3):
+            self.latencies.timed_out('http://npr.org/slow', self.latencies.timeout('http://npr.org/slow'))
+
+        assert self.latencies.timeout('http://npr.org/') == 2
+
+    def test_persisted(self):
+        for i in range(60):
+            self.latencies.record('http://slow.example.com/%i' % i, 3)
+
+        self.latencies.save()
+
+        latencies = HostLatencies(self.path)
+
+        assert len(latencies.latencies['slow.example.com']) == 50
+        assert latencies.timeout('http://slow.example.com/') == 6
+
+class RateLimiterTestCase(unittest.TestCase):
+    """
+    Test the per-host token bucket.
+    """
+    def test_burst_then_rate(self):
+        limiter = RateLimiter(rate=2, burst=2)
+
+        assert limiter.reserve('http://npr.org/a') == 0
+        assert limiter.reserve('http://npr.org/b') == 0
+        assert 0.45 < limiter.reserve('http://npr.org/c') <= 0.5
+        assert 0.95 < limiter.reserve('http://npr.org/d') <= 1
+
+    def test_hosts_independent(self):
+        limiter = RateLimiter(rate=1, burst=1)
+
+        assert limiter.reserve('http://npr.org/a') == 0
+        assert limiter.reserve('http://example.com/a') == 0
+        assert limiter.reserve('http://npr.org/b') > 0
+
+    def test_interleave_by_host(self):
+        urls = ['http://a.com/1', 'http://a.com/2', 'http://a.com/3', 'http://b.com/1', 'http://c.com/1']
+
+        assert interleave_by_host(urls) == ['http://a.com/1', 'http://b.com/1', 'http://c.com/1', 'http://a.com/2', 'http://a.com/3']
+
+if __name__ == '__main__':
+    unittest.main()
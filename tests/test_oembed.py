@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+import json
+import os
+import tempfile
+import unittest
+
+import httpretty
+
+from etc.failures import NegativeCache
+from etc.oembed import Registry, UnfurlStats, registry
+
+class OEmbedTestCase(unittest.TestCase):
+    """
+    Test unfurling media links through oEmbed against stub endpoints.
+    """
+    def test_provider_for(self):
+        assert registry.provider_for('https://www.youtube.com/watch?v=abc123')[0].name == 'youtube'
+        assert registry.provider_for('http://youtu.be/abc123')[0].name == 'youtube'
+        assert registry.provider_for('https://vimeo.com/76979871')[0].name == 'vimeo'
+        assert registry.provider_for('https://soundcloud.com/npr/tiny-desk')[0].name == 'soundcloud'
+        assert registry.provider_for('http://instagram.com/p/xyz/')[0].name == 'instagram'
+        assert registry.provider_for('https://vimeo.com/about') == (None, None)
+        assert registry.provider_for('http://www.npr.org/story') == (None, None)
+
+    @httpretty.activate
+    def test_vimeo(self):
+        httpretty.register_uri(httpretty.GET, 'https://vimeo.com/api/oembed.json', body=json.dumps({
+            'title': 'The New Vimeo Player',
+            'description': 'It may look simple',
+            'thumbnail_url': 'https://i.vimeocdn.com/video/452001751_295x166.jpg'
+        }))
+
+        page = registry.unfurl('https://vimeo.com/76979871')
+
+        assert httpretty.last_request().querystring['url'] == ['https://vimeo.com/76979871']
+        assert page == {
+            'url': 'https://vimeo.com/76979871',
+            'canonical_url': 'https://vimeo.com/76979871',
+            'title': 'The New Vimeo Player',
+            'description': 'It may look simple',
+            'image': 'https://i.vimeocdn.com/video/452001751_295x166.jpg'
+        }
+
+    @httpretty.activate
+    def test_youtube_derived_fields(self):
+        httpretty.register_uri(httpretty.GET, 'https://www.youtube.com/oembed', body=json.dumps({
+            'title': 'Tiny Desk Concert',
+            'author_name': 'NPR Music'
+        }))
+
+        page = registry.unfurl('http://youtu.be/abc123')
+
+        assert page['title'] == 'Tiny Desk Concert'
+        assert page['description'] == 'NPR Music'
+        assert page['image'] == 'https://i.ytimg.com/vi/abc123/hqdefault.jpg'
+        assert page['canonical_url'] == 'https://www.youtube.com/watch?v=abc123'
+
+    @httpretty.activate
+    def test_falls_back(self):
+        httpretty.register_uri(httpretty.GET, 'https://soundcloud.com/oembed', status=404, body='Not found')
+
+        stats = UnfurlStats()
+
+        assert registry.unfurl('https://soundcloud.com/npr/gone', stats=stats) is None
+        assert stats.counts == { 'soundcloud': { 'unfurled': 0, 'fell_back': 1 } }
+
+    @httpretty.activate
+    def test_endpoint_failures(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+        httpretty.register_uri(httpretty.GET, 'https://soundcloud.com/oembed', responses=[
+            httpretty.Response(body='Not found', status=404),
+            httpretty.Response(body='Unavailable', status=503)
+        ])
+
+        try:
+            negative_cache = NegativeCache(path)
+
+            registry.unfurl('https://soundcloud.com/npr/gone', negative_cache=negative_cache)
+
+            assert not negative_cache.host_penalized('https://soundcloud.com/oembed')
+
+            registry.unfurl('https://soundcloud.com/npr/down', negative_cache=negative_cache)
+        finally:
+            os.remove(path)
+
+        assert negative_cache.host_penalized('https://soundcloud.com/oembed')
+        assert negative_cache.entries['host:soundcloud.com']['reason'] == 'oEmbed HTTP 503'
+        assert negative_cache.blocked('https://soundcloud.com/npr/down') is None
+
+    @httpretty.activate
+    def test_register(self):
+        custom = Registry()
+        custom.register('example', r'https?://video\.example\.com/', 'http://example.com/oembed')
+
+        httpretty.register_uri(httpretty.GET, 'http://example.com/oembed', body=json.dumps({ 'title': 'A video' }))
+
+        stats = UnfurlStats()
+
+        assert custom.unfurl('http://video.example.com/1', stats=stats)['title'] == 'A video'
+        assert custom.unfurl('http://www.npr.org/story', stats=stats) is None
+        assert stats.report() == ['oEmbed:', '    example: 1 unfurled, 0 fell back to the page']
+
+        # Each run counts only its own links
+        assert UnfurlStats().report() == []
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+from datetime import datetime, timedelta
+import os
+import time
+import unittest
+
+from etc.prefetch import PrefetchStore, TWITTER_DATE_FORMAT
+
+def make_tweet(tweet_id, days_ago=0):
+    created = datetime.utcnow() - timedelta(days=days_ago)
+
+    return { 'id': tweet_id, 'text': 'Look', 'created_at': created.strftime(TWITTER_DATE_FORMAT) }
+
+class PrefetchStoreTestCase(unittest.TestCase):
+    """
+    Test storing tweets and unfurled pages between linklater runs.
+    """
+    def setUp(self):
+        self.store = PrefetchStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_tweets(self):
+        assert self.store.last_tweet_id('nprviz') is None
+
+        self.store.add_tweets('nprviz', [make_tweet(1, days_ago=10), make_tweet(3), make_tweet(2)])
+        self.store.add_tweets('nprviz', [make_tweet(3)])
+        self.store.add_tweets('nprnews', [make_tweet(4)])
+
+        assert self.store.last_tweet_id('nprviz') == 3
+        assert [tweet['id'] for tweet in self.store.tweets('nprviz', 7)] == [3, 2]
+
+    def test_pages(self):
+        self.store.add_pages({
+            'http://npr.org/a': { 'url': 'http://npr.org/a', 'title': 'A' },
+            'http://npr.org/b': None
+        })
+
+        pages = self.store.pages(['http://npr.org/a', 'http://npr.org/b', 'http://npr.org/c'])
+
+        assert pages == { 'http://npr.org/a': { 'url': 'http://npr.org/a', 'title': 'A' } }
+
+    def test_prune(self):
+        self.store.add_tweets('nprviz', [make_tweet(1, days_ago=40), make_tweet(2)])
+        self.store.prune(30)
+
+        assert [tweet['id'] for tweet in self.store.tweets('nprviz', 60)] == [2]
+
+    def test_prune_pages(self):
+        tz = os.environ.get('TZ')
+
+        # Twelve hours behind UTC, where mixing UTC and local time shows
+        os.environ['TZ'] = 'Etc/GMT+12'
+        time.tzset()
+
+        try:
+            self.store.add_pages({ 'http://npr.org/old': { 'title': 'Old' }, 'http://npr.org/recent': { 'title': 'Recent' } })
+            self.store.connection.execute('UPDATE prefetched_pages SET fetched = ? WHERE url = ?', (time.time() - 31 * 86400, 'http://npr.org/old'))
+            self.store.connection.execute('UPDATE prefetched_pages SET fetched = ? WHERE url = ?', (time.time() - 29.75 * 86400, 'http://npr.org/recent'))
+
+            self.store.prune(30)
+        finally:
+            if tz is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = tz
+
+            time.tzset()
+
+        assert self.store.pages(['http://npr.org/old', 'http://npr.org/recent']).keys() == ['http://npr.org/recent']
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+import os
+import tempfile
+import unittest
+
+import httpretty
+
+from etc.redirects import RedirectResolver, is_shortener
+
+class RedirectResolverTestCase(unittest.TestCase):
+    """
+    Test resolving short links with HEAD requests against fake endpoints.
+    """
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+        self.resolver = RedirectResolver(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_is_shortener(self):
+        assert is_shortener('http://bit.ly/abc')
+        assert is_shortener('http://www.n.pr/abc')
+        assert not is_shortener('http://www.npr.org/abc')
+
+    @httpretty.activate
+    def test_resolve_chain(self):
+        httpretty.register_uri(httpretty.HEAD, 'http://t.co/abc', status=301, location='http://bit.ly/def')
+        httpretty.register_uri(httpretty.HEAD, 'http://bit.ly/def', status=301, location='http://www.npr.org/story')
+
+        assert self.resolver.resolve('http://t.co/abc') == 'http://www.npr.org/story'
+        assert self.resolver.stats['hops'] == 2
+        assert [request.method for request in httpretty.HTTPretty.latest_requests] == ['HEAD', 'HEAD']
+
+    @httpretty.activate
+    def test_not_a_shortener(self):
+        assert self.resolver.resolve('http://www.npr.org/story') == 'http://www.npr.org/story'
+        assert len(httpretty.HTTPretty.latest_requests) == 0
+
+    @httpretty.activate
+    def test_head_not_allowed(self):
+        httpretty.register_uri(httpretty.HEAD, 'http://ow.ly/abc', status=405)
+
+        assert self.resolver.resolve('http://ow.ly/abc') == 'http://ow.ly/abc'
+        assert self.resolver.redirects == {}
+
+    @httpretty.activate
+    def test_persisted(self):
+        httpretty.register_uri(httpretty.HEAD, 'http://n.pr/abc', status=301, location='http://www.npr.org/story')
+
+        self.resolver.resolve('http://n.pr/abc')
+        self.resolver.save()
+
+        resolver = RedirectResolver(self.path)
+
+        assert resolver.resolve('http://n.pr/abc') == 'http://www.npr.org/story'
+        assert resolver.stats == { 'cached': 1, 'hops': 0 }
+        assert len(httpretty.HTTPretty.latest_requests) == 1
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+import json
+import os
+import tempfile
+import unittest
+
+import app_config
+from fabfile import render
+
+def make_report(gzip_size):
+    return {
+        'minified_size': gzip_size * 3,
+        'gzip_size': gzip_size,
+        'inputs': [{
+            'path': 'www/js/app.js',
+            'raw_size': gzip_size * 5,
+            'minified_size': gzip_size * 3,
+            'gzip_size': gzip_size,
+            'minify_time': 0.01
+        }]
+    }
+
+class CheckBundlesTestCase(unittest.TestCase):
+    """
+    Test the bundle size report and budget written by "fab render".
+    """
+    def setUp(self):
+        fd, self.report_path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+
+        self.original_report_path = app_config.BUNDLE_REPORT_PATH
+        self.original_budget = app_config.BUNDLE_GZIP_BUDGET
+
+        app_config.BUNDLE_REPORT_PATH = self.report_path
+        app_config.BUNDLE_GZIP_BUDGET = 1000
+
+    def tearDown(self):
+        app_config.BUNDLE_REPORT_PATH = self.original_report_path
+        app_config.BUNDLE_GZIP_BUDGET = self.original_budget
+
+        os.remove(self.report_path)
+
+    def test_within_budget(self):
+        render._check_bundles({ 'www/js/app.min.js': make_report(1000) })
+
+        with open(self.report_path) as f:
+            assert json.load(f)['www/js/app.min.js']['gzip_size'] == 1000
+
+    def test_over_budget(self):
+        with self.assertRaises(SystemExit):
+            render._check_bundles({ 'www/js/app.min.js': make_report(500), 'www/css/app.min.css': make_report(1001) })
+
+        # The report is still written so you can see what grew
+        with open(self.report_path) as f:
+            assert sorted(json.load(f)) == ['www/css/app.min.css', 'www/js/app.min.js']
+
+    def test_no_budget(self):
+        app_config.BUNDLE_GZIP_BUDGET = 0
+
+        render._check_bundles({ 'www/js/app.min.js': make_report(1001) })
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from flask import Flask, Markup, g, make_response, render_template
+from jinja2 import DictLoader
+from openpyxl import Workbook
+
+import app_config
+import copytext
+import render_utils
+
+class PageCacheTestCase(unittest.TestCase):
+    """
+    Test the rendered page cache used by public_app.
+    """
+    def setUp(self):
+        self.ttl = app_config.PAGE_CACHE_TTL
+        app_config.PAGE_CACHE_TTL = 60
+        render_utils.page_cache.clear()
+
+        self.renders = 0
+
+        test_app = Flask(__name__)
+
+        @test_app.route('/page/')
+        @render_utils.cache_page()
+        def page():
+            self.renders += 1
+
+            return make_response('rendered %i' % self.renders)
+
+        self.client = test_app.test_client()
+
+    def tearDown(self):
+        app_config.PAGE_CACHE_TTL = self.ttl
+        render_utils.page_cache.clear()
+
+    def test_cache_hit(self):
+        first = self.client.get('/page/')
+        second = self.client.get('/page/')
+
+        assert first.data == second.data == 'rendered 1'
+        assert self.renders == 1
+
+    def test_cache_clear(self):
+        self.client.get('/page/')
+
+        render_utils.page_cache.clear()
+
+        assert self.client.get('/page/').data == 'rendered 2'
+
+    def test_cache_disabled(self):
+        app_config.PAGE_CACHE_TTL = 0
+
+        self.client.get('/page/')
+        self.client.get('/page/')
+
+        assert self.renders == 2
+
+def write_spreadsheet(path, title):
+    book = Workbook()
+    sheet = book.get_active_sheet()
+    sheet.title = 'content'
+
+    for coordinate, value in (('A1', 'key'), ('B1', 'value'), ('A2', 'title'), ('B2', title)):
+        sheet.cell(coordinate).value = value
+
+    book.save(path)
+
+class LoadCopyTestCase(unittest.TestCase):
+    """
+    Test loading copy from the snapshot or, failing that, the spreadsheet.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.copy_path = app_config.COPY_PATH
+        self.snapshot_path = app_config.COPY_SNAPSHOT_PATH
+        self.load = copytext.Copy.load
+        self.sheets = dict(copytext.Copy._copy)
+
+        app_config.COPY_PATH = os.path.join(self.directory, 'copy.xlsx')
+        app_config.COPY_SNAPSHOT_PATH = os.path.join(self.directory, 'copy.pickle')
+
+        self.parsed = []
+
+        def counting_load(copy):
+            self.parsed.append(copy._filename)
+
+            return self.load(copy)
+
+        copytext.Copy.load = counting_load
+
+        write_spreadsheet(app_config.COPY_PATH, u'Cats')
+
+    def tearDown(self):
+        app_config.COPY_PATH = self.copy_path
+        app_config.COPY_SNAPSHOT_PATH = self.snapshot_path
+        copytext.Copy.load = self.load
+        copytext.Copy._copy.clear()
+        copytext.Copy._copy.update(self.sheets)
+
+        shutil.rmtree(self.directory)
+
+    def title(self):
+        return unicode(render_utils.load_copy()['content']['title'])
+
+    def test_snapshot(self):
+        render_utils.write_copy_snapshot()
+
+        assert self.title() == u'Cats'
+        assert len(self.parsed) == 1
+
+    def test_snapshot_round_trip(self):
+        render_utils.write_copy_snapshot()
+
+        # As if loading the snapshot in a fresh process
+        copytext.Copy._copy.clear()
+
+        copy = render_utils.load_copy()
+
+        assert unicode(copy['content']['title']) == u'Cats'
+        assert json.loads(copy.json()) == { 'content': { 'title': 'Cats' } }
+        assert len(self.parsed) == 1
+
+    def test_stale_snapshot(self):
+        render_utils.write_copy_snapshot()
+
+        write_spreadsheet(app_config.COPY_PATH, u'Dogs')
+        os.utime(app_config.COPY_PATH, (time.time() + 10, time.time() + 10))
+
+        assert self.title() == u'Dogs'
+        assert len(self.parsed) == 2
+
+    def test_missing_snapshot(self):
+        assert self.title() == u'Cats'
+        assert len(self.parsed) == 1
+
+    def test_unreadable_snapshot(self):
+        with open(app_config.COPY_SNAPSHOT_PATH, 'w') as f:
+            f.write('not a pickle')
+
+        assert self.title() == u'Cats'
+        assert len(self.parsed) == 1
+
+    def test_missing_spreadsheet(self):
+        render_utils.write_copy_snapshot()
+        os.remove(app_config.COPY_PATH)
+
+        assert self.title() == u'Cats'
+        assert len(self.parsed) == 1
+
+class LRUCacheTestCase(unittest.TestCase):
+    """
+    Test the cache behind the memoized template filters.
+    """
+    def test_hits_and_misses(self):
+        cache = render_utils.LRUCache(2)
+
+        assert cache.get('a', lambda k: k.upper()) == 'A'
+        assert cache.get('a', lambda k: 'computed again') == 'A'
+
+        assert cache.stats() == { 'hits': 1, 'misses': 1, 'size': 1 }
+
+    def test_eviction(self):
+        cache = render_utils.LRUCache(2)
+
+        cache.get('a', lambda k: k)
+        cache.get('b', lambda k: k)
+        cache.get('a', lambda k: k)
+        cache.get('c', lambda k: k)
+
+        # 'b' was least recently used
+        assert cache.get('a', lambda k: 'evicted') == 'a'
+        assert cache.get('b', lambda k: 'evicted') == 'evicted'
+
+    def test_disabled(self):
+        cache = render_utils.LRUCache(0)
+
+        cache.get('a', lambda k: k)
+
+        assert cache.stats()['size'] == 0
+
+    def test_threads(self):
+        cache = render_utils.LRUCache(8)
+
+        def work():
+            for i in range(2000):
+                cache.get(i % 16, lambda k: k)
+
+        threads = [threading.Thread(target=work) for i in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        stats = cache.stats()
+
+        assert stats['hits'] + stats['misses'] == 16000
+        assert stats['size'] == 8
+
+class FilterTestCase(unittest.TestCase):
+    """
+    Test the smarty and urlencode template filters.
+    """
+    def setUp(self):
+        for cache in render_utils.filter_caches.values():
+            cache.clear()
+
+    def test_smarty(self):
+        assert render_utils.smarty_filter(u'"Hello"') == u'&#8220;Hello&#8221;'
+
+    def test_smarty_memoized(self):
+        render_utils.smarty_filter(u'"Hello"')
+        render_utils.smarty_filter(u'"Hello"')
+
+        stats = render_utils.filter_cache_stats()['smarty']
+
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+    def test_smarty_unicode(self):
+        assert render_utils.smarty_filter(u'caf\xe9 -- "ol\xe9"') == u'caf\xe9 &#8212; &#8220;ol\xe9&#8221;'
+
+    def test_smarty_markup(self):
+        output = render_utils.smarty_filter(Markup(u'<b>"Hi"</b> &amp; bye'))
+
+        assert output == u'<b>&#8220;Hi&#8221;</b> &amp; bye'
+        assert isinstance(output, Markup)
+
+    def test_urlencode(self):
+        assert render_utils.urlencode_filter(u'a b&c') == u'a+b%26c'
+
+    def test_urlencode_markup(self):
+        assert render_utils.urlencode_filter(Markup(u'a &amp; b')) == u'a+%26+b'
+
+    def test_urlencode_unicode(self):
+        assert render_utils.urlencode_filter(u'caf\xe9') == u'caf%C3%A9'
+
+    def test_urlencode_copy_element(self):
+        class Cell(object):
+            def __unicode__(self):
+                return u'a b'
+
+        assert render_utils.urlencode_filter(Cell()) == u'a+b'
+
+class RenderProfilerTestCase(unittest.TestCase):
+    """
+    Test opt-in render profiling.
+    """
+    def setUp(self):
+        test_app = Flask(__name__)
+        test_app.jinja_loader = DictLoader({
+            'page.html': '{% include "part.html" %}',
+            'part.html': '{{ name|upper }}'
+        })
+
+        render_utils.install_render_profiler(test_app)
+
+        @test_app.route('/')
+        def page():
+            with render_utils.profile_section('work'):
+                pass
+
+            return make_response(render_template('page.html', name='linklater'))
+
+        self.app = test_app
+        self.client = test_app.test_client()
+
+    def test_profile(self):
+        response = self.client.get('/?profile=1')
+        header = response.headers['Server-Timing']
+
+        assert response.data == 'LINKLATER'
+
+        for label in ('work', 'template page.html', 'include part.html', 'filter upper'):
+            assert label in header
+
+    def test_environment_unchanged_by_requests(self):
+        upper = self.app.jinja_env.filters['upper']
+        get_template = self.app.jinja_env.get_template
+
+        self.client.get('/?profile=1')
+
+        assert self.app.jinja_env.filters['upper'] is upper
+        assert self.app.jinja_env.get_template is get_template
+
+    def test_not_profiled(self):
+        response = self.client.get('/')
+
+        assert 'Server-Timing' not in response.headers
+
+def _negate(value):
+    return -value
+
+def _explode(value):
+    raise ValueError(value)
+
+class CompressPoolTestCase(unittest.TestCase):
+    """
+    Test the minifier pool shared across a build.
+    """
+    def setUp(self):
+        self.processes = app_config.COMPRESS_PROCESSES
+        app_config.COMPRESS_PROCESSES = 2
+
+        self.app = Flask(__name__)
+
+    def tearDown(self):
+        app_config.COMPRESS_PROCESSES = self.processes
+
+    def test_shared_pool(self):
+        with render_utils.compress_pool() as pool:
+            with self.app.test_request_context('/'):
+                g.compress_pool = pool
+
+                assert render_utils._parallel_map(_negate, range(4)) == [0, -1, -2, -3]
+                assert render_utils._parallel_map(_negate, range(8)) == [-i for i in range(8)]
+
+        assert not any(worker.is_alive() for worker in pool._pool)
+
+    def test_small_bundles_serial(self):
+        class Pool(object):
+            def map(self, *args, **kwargs):
+                raise AssertionError('pool used')
+
+        with self.app.test_request_context('/'):
+            g.compress_pool = Pool()
+
+            assert render_utils._parallel_map(_negate, range(3)) == [0, -1, -2]
+
+    def test_no_pool(self):
+        app_config.COMPRESS_PROCESSES = 1
+
+        with render_utils.compress_pool() as pool:
+            assert pool is None
+
+        with self.app.test_request_context('/'):
+            assert render_utils._parallel_map(_negate, range(8)) == [-i for i in range(8)]
+
+    def test_closed_on_error(self):
+        with self.assertRaises(ValueError):
+            with render_utils.compress_pool() as pool:
+                with self.app.test_request_context('/'):
+                    g.compress_pool = pool
+
+                    render_utils._parallel_map(_explode, range(4))
+
+        assert not any(worker.is_alive() for worker in pool._pool)
+
+class BundleTestCase(unittest.TestCase):
+    """
+    Test joining minified files into a bundle with a source map.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def result(self, name, output):
+        return {
+            'path': os.path.join(self.directory, 'js', name),
+            'output': output,
+            'raw_size': 100,
+            'minified_size': len(output),
+            'gzip_size': 50,
+            'minify_time': 0.01
+        }
+
+    def test_vlq(self):
+        assert render_utils._vlq(0) == 'A'
+        assert render_utils._vlq(1) == 'C'
+        assert render_utils._vlq(-1) == 'D'
+        assert render_utils._vlq(15) == 'e'
+        assert render_utils._vlq(16) == 'gB'
+        assert render_utils._vlq(123) == '2H'
+
+    def test_source_map(self):
+        out_path = os.path.join(self.directory, 'app.min.js')
+        results = [self.result('a.js', u'var a;\nvar b;'), self.result('b.js', u'var c;')]
+
+        with self.app.test_request_context('/'):
+            g.bundle_reports = {}
+
+            bundle = render_utils.JavascriptIncluder()._bundle(out_path, u'/* header */', results)
+            reports = g.bundle_reports
+
+        with open('%s.map' % out_path) as f:
+            source_map = json.load(f)
+
+        mappings = source_map['mappings'].split(';')
+
+        assert bundle.split('\n')[-1] == '//# sourceMappingURL=app.min.js.map'
+        assert source_map['sources'] == ['js/a.js', 'js/b.js']
+
+        # One line per bundle line, less the sourceMappingURL comment
+        assert len(mappings) == len(bundle.split('\n')) - 1
+        assert mappings == ['', 'AAAA', 'AAAA', 'ACAA']
+
+        assert reports[out_path]['minified_size'] == len(bundle.encode('utf-8'))
+        assert [item['path'] for item in reports[out_path]['inputs']] == [result['path'] for result in results]
+        assert 'output' not in reports[out_path]['inputs'][0]
+
+if __name__ == '__main__':
+    unittest.main()
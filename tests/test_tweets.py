@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+import unittest
+
+from etc.tweets import linkify, linkify_tweet
+
+class LinkifyTestCase(unittest.TestCase):
+    """
+    Test the single-pass tweet entity linkifier.
+    """
+    def test_entities(self):
+        tweet = {
+            'text': u'Look #npr http://t.co/abc',
+            'entities': {
+                'hashtags': [{ 'text': 'npr', 'indices': [5, 9] }],
+                'urls': [{ 'url': 'http://t.co/abc', 'expanded_url': 'http://npr.org', 'display_url': 'npr.org', 'indices': [10, 25] }]
+            }
+        }
+
+        assert linkify_tweet(tweet) == u'Look <a href="https://twitter.com/hashtag/npr">#npr</a> <a href="http://npr.org">npr.org</a>'
+
+    def test_substring_entities(self):
+        # "#npr" is a prefix of "#nprviz"; replacing by text would mangle it
+        entities = {
+            'hashtags': [
+                { 'text': 'nprviz', 'indices': [0, 7] },
+                { 'text': 'npr', 'indices': [8, 12] }
+            ]
+        }
+
+        html = linkify(u'#nprviz #npr', entities, lambda kind, entity: '[%s]' % entity['text'])
+
+        assert html == u'[nprviz] [npr]'
+
+    def test_skipped_and_overlapping_entities(self):
+        entities = {
+            'urls': [{ 'indices': [0, 4] }, { 'indices': [2, 6] }],
+            'symbols': [{ 'indices': [7, 8] }]
+        }
+
+        html = linkify(u'abcdef $', entities, lambda kind, entity: '<%s>' % kind if kind == 'urls' else None)
+
+        assert html == u'<urls>ef $'
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+
+import httpretty
+from twitter import Twitter, OAuth, TwitterHTTPError
+
+from etc.twitter_client import RateLimitedTwitter
+
+TIMELINE_URL = 'https://api.twitter.com/1.1/statuses/user_timeline.json'
+
+class FakeClock(object):
+    def __init__(self, now=1000):
+        self.now = now
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+def rate_limit_headers(remaining, reset, limit=180):
+    return {
+        'x-rate-limit-limit': str(limit),
+        'x-rate-limit-remaining': str(remaining),
+        'x-rate-limit-reset': str(reset)
+    }
+
+class RateLimitedTwitterTestCase(unittest.TestCase):
+    """
+    Test scheduling Twitter API calls against a fake endpoint.
+    """
+    def setUp(self):
+        self.fake = FakeClock()
+        self.twitter_api = RateLimitedTwitter(
+            Twitter(auth=OAuth('token', 'secret', 'key', 'secret')),
+            clock=self.fake.clock,
+            sleep=self.fake.sleep
+        )
+
+    @httpretty.activate
+    def test_tracks_budget(self):
+        httpretty.register_uri(httpretty.GET, TIMELINE_URL, body='[]', **rate_limit_headers(179, 1900))
+
+        assert self.twitter_api.remaining('statuses/user_timeline') is None
+
+        self.twitter_api.statuses.user_timeline(screen_name='nprviz')
+
+        assert self.twitter_api.remaining('statuses/user_timeline') == 179
+        assert self.fake.sleeps == []
+        assert 'statuses/user_timeline: 179 of 180 left, resets in 900s' in self.twitter_api.report()[1]
+
+    @httpretty.activate
+    def test_waits_for_reset(self):
+        httpretty.register_uri(httpretty.GET, TIMELINE_URL, body='[]', **rate_limit_headers(0, 1900))
+
+        self.twitter_api.statuses.user_timeline(screen_name='nprviz')
+        self.twitter_api.statuses.user_timeline(screen_name='nprviz')
+
+        assert self.fake.sleeps == [901]
+        assert len(httpretty.HTTPretty.latest_requests) == 2
+
+    @httpretty.activate
+    def test_paces_when_low(self):
+        httpretty.register_uri(httpretty.GET, TIMELINE_URL, body='[]', **rate_limit_headers(2, 1900))
+
+        self.twitter_api.statuses.user_timeline(screen_name='nprviz')
+        self.twitter_api.statuses.user_timeline(screen_name='nprviz')
+
+        # Two calls left, spread so both land inside the window
+        assert self.fake.sleeps == [300]
+
+    @httpretty.activate
+    def test_last_call_in_window(self):
+        httpretty.register_uri(httpretty.GET, TIMELINE_URL, responses=[
+            httpretty.Response(body='[]', **rate_limit_headers(1, 1900)),
+            httpretty.Response(body='[]', **rate_limit_headers(0, 1900)),
+            httpretty.Response(body='[]', **rate_limit_headers(179, 2800))
+        ])
+
+        self.twitter_api.statuses.user_timeline(screen_name='nprviz')
+        self.twitter_api.statuses.user_timeline(screen_name='nprviz')
+        self.twitter_api.statuses.user_timeline(screen_name='nprviz')
+
+        # The last call is made halfway to the reset, the next waits for it
+        assert self.fake.sleeps == [450, 451]
+
+    @httpretty.activate
+    def test_retries_after_429(self):
+        responses = [
+            httpretty.Response(body='{"errors": []}', status=429, **rate_limit_headers(0, 1060)),
+            httpretty.Response(body=json.dumps([{ 'id': 1 }]), **rate_limit_headers(179, 1960))
+        ]
+
+        httpretty.register_uri(httpretty.GET, TIMELINE_URL, responses=responses)
+
+        tweets = self.twitter_api.statuses.user_timeline(screen_name='nprviz')
+
+        assert tweets[0]['id'] == 1
+        assert self.fake.sleeps == [61]
+        assert self.twitter_api.stats['throttled'] == 1
+
+    @httpretty.activate
+    def test_gives_up_after_retries(self):
+        httpretty.register_uri(httpretty.GET, TIMELINE_URL, body='{"errors": []}', status=429, **rate_limit_headers(0, 1060))
+
+        self.twitter_api.max_retries = 1
+
+        self.assertRaises(TwitterHTTPError, self.twitter_api.statuses.user_timeline, screen_name='nprviz')
+
+    @httpretty.activate
+    def test_other_errors_raise(self):
+        httpretty.register_uri(httpretty.GET, TIMELINE_URL, body='{"errors": []}', status=401)
+
+        self.assertRaises(TwitterHTTPError, self.twitter_api.statuses.user_timeline, screen_name='nprviz')
+        assert self.fake.sleeps == []
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""
+Development file watcher for app.py.
+
+Watches the source directories for changes, recompiles only the
+assets that depend on a changed directory into an in-memory cache
+and tells connected browsers to reload over an event stream.
+
+Uses inotify (via pyinotify) when it's installed, otherwise polls.
+"""
+
+import os
+import Queue
+import threading
+import time
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+WATCHED_DIRS = ['less', 'jst', 'templates', 'data']
+
+# How often pending changes are processed (and, without inotify, how often to poll)
+INTERVAL = 0.25
+
+_watcher = None
+
+class Watcher(object):
+    """
+    Keeps compiled assets in memory and rebuilds them when the
+    directory they're compiled from changes.
+    """
+    def __init__(self, dirs):
+        self.dirs = dirs
+        self.cache = {}
+        self.builders = {}
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.dirty = set()
+
+    def start(self):
+        if pyinotify:
+            self._start_inotify()
+        else:
+            self._start_polling()
+
+        thread = threading.Thread(target=self._process)
+        thread.daemon = True
+        thread.start()
+
+    def _start_inotify(self):
+        watcher = self
+
+        class Handler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                watcher.touch(event.pathname)
+
+        manager = pyinotify.WatchManager()
+        mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_CREATE | pyinotify.IN_DELETE | pyinotify.IN_MOVED_TO | pyinotify.IN_MOVED_FROM
+
+        notifier = pyinotify.ThreadedNotifier(manager, Handler())
+        notifier.daemon = True
+        notifier.start()
+
+        manager.add_watch([os.path.abspath(d) for d in self.dirs], mask, rec=True, auto_add=True)
+
+    def _start_polling(self):
+        thread = threading.Thread(target=self._poll)
+        thread.daemon = True
+        thread.start()
+
+    def _snapshot(self, directory):
+        """
+        Cheap summary of a directory tree that changes whenever a file does.
+        """
+        summary = []
+
+        for dirpath, dirnames, filenames in os.walk(directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                summary.append((path, stat.st_mtime, stat.st_size))
+
+        return sorted(summary)
+
+    def _poll(self):
+        snapshots = dict((d, self._snapshot(d)) for d in self.dirs)
+
+        while True:
+            time.sleep(INTERVAL)
+
+            for directory in self.dirs:
+                snapshot = self._snapshot(directory)
+
+                if snapshot != snapshots[directory]:
+                    snapshots[directory] = snapshot
+                    self.touch(directory)
+
+    def touch(self, path):
+        """
+        Mark the watched directory containing `path` as changed.
+        """
+        directory = os.path.relpath(path).split(os.sep)[0]
+
+        with self.lock:
+            self.dirty.add(directory)
+
+    def _process(self):
+        """
+        Handle changes in batches so a burst of saves only rebuilds once.
+        """
+        while True:
+            time.sleep(INTERVAL)
+
+            with self.lock:
+                dirty, self.dirty = self.dirty, set()
+
+            for directory in dirty:
+                self.changed(directory)
+
+    def changed(self, directory):
+        """
+        Rebuild every cached asset compiled from `directory`, then
+        notify listeners.
+        """
+        for key, (source, build) in self.builders.items():
+            if source != directory:
+                continue
+
+            try:
+                self.cache[key] = build()
+            except Exception:
+                # Rebuild (and fail loudly) on the next request instead
+                self.cache.pop(key, None)
+
+        print 'Reloading: %s changed' % directory
+
+        for listener in list(self.listeners):
+            listener.put(directory)
+
+    def cached(self, key, directory, build):
+        """
+        Return the cached output for `key`, building it on first use.
+        """
+        self.builders[key] = (directory, build)
+
+        if key not in self.cache:
+            self.cache[key] = build()
+
+        return self.cache[key]
+
+    def events(self):
+        """
+        Server-sent event stream of changed directories.
+        """
+        listener = Queue.Queue()
+        self.listeners.append(listener)
+
+        try:
+            yield 'retry: 1000\n\n'
+
+            while True:
+                try:
+                    directory = listener.get(timeout=15)
+                except Queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+
+                yield 'event: change\ndata: %s\n\n' % directory
+        finally:
+            self.listeners.remove(listener)
+
+def start(dirs=WATCHED_DIRS):
+    """
+    Start watching. Assets passed through `cached` are served from
+    memory from then on.
+    """
+    global _watcher
+
+    _watcher = Watcher(dirs)
+    _watcher.start()
+
+    return _watcher
+
+def get():
+    return _watcher
+
+def cached(key, directory, build):
+    """
+    Serve `build()` from the watcher's cache if it's running,
+    otherwise just build it.
+    """
+    if _watcher is None:
+        return build()
+
+    return _watcher.cached(key, directory, build)